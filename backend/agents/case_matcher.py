@@ -1,13 +1,23 @@
 import os
-import json
-import requests
+import re
+import orjson
+import httpx
+import numpy as np
 from typing import Dict, Any
 from dotenv import load_dotenv
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
 
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from langgraph.graph import StateGraph, END
 
+from backend.utils.http_client import get_http_client, run_sync
+from backend.utils.patient_context import patient_context
+from backend.utils.response_cache import disk_cached
+from backend.utils.degraded import mark_degraded
+from backend.utils.prompts import build_messages
+
 # -------------------------------
 # Load environment variables
 # -------------------------------
@@ -15,42 +25,35 @@ load_dotenv()
 BIOPORTAL_API_KEY = os.getenv("BIOPORTAL_API_KEY")  # ✅ Must be set in .env
 
 BIOPORTAL_API_URL = "https://data.bioontology.org/search"
+# purl @id: http://purl.bioontology.org/ontology/<ONTOLOGY>/<code>; other IRIs
+# (e.g. NCIt's .../EVS/Thesaurus.owl#C2985) must not match
+_ID_RE = re.compile(r"/ontology/([^/]+)/([^/]+)$")
+# The LLM picks the top 3 matches; at or below this it has nothing to rank
+LLM_RANK_MIN_RESULTS = 3
 
 # -------------------------------
 # Fetch Case Matches from BioPortal
 # -------------------------------
 def calculate_match_score(query: str, result_name: str, match_type: str = "prefLabel") -> float:
     """Calculate a match score based on query similarity"""
-    query_lower = query.lower()
-    name_lower = result_name.lower()
-    
-    # Exact match
-    if query_lower == name_lower:
-        return 95.0
-    
-    # Query is substring of result or vice versa
-    if query_lower in name_lower or name_lower in query_lower:
-        return 85.0
-    
-    # Word overlap scoring
-    query_words = set(query_lower.split())
-    name_words = set(name_lower.split())
-    
-    if not query_words or not name_words:
-        return 60.0
-    
-    common_words = query_words & name_words
-    overlap_ratio = len(common_words) / max(len(query_words), len(name_words))
-    
+    similarity = fuzz.WRatio(query, result_name, processor=default_process)
     # Match type bonus
     match_type_bonus = 10.0 if match_type == "prefLabel" else 0.0
-    
-    # Calculate score: 60-90% based on word overlap + bonus
-    score = 60.0 + (overlap_ratio * 30.0) + match_type_bonus
-    
-    return min(95.0, score)  # Cap at 95%
+    return min(95.0, similarity + match_type_bonus)  # Cap at 95%
 
-def fetch_case_matches(query: str, max_results: int = 5):
+
+def _batch_match_scores(query: str, names: list, match_types: list) -> np.ndarray:
+    """Final scores for a ranked result list, computed in one vectorized pass."""
+    # One C call scores every name (same formula as calculate_match_score)
+    similarities = process.cdist([query], names, scorer=fuzz.WRatio, processor=default_process, dtype=np.float64)[0]
+    bonus = np.where(np.asarray(match_types) == "prefLabel", 10.0, 0.0)
+    scores = np.minimum(95.0, similarities + bonus)
+    # Reduce score for subsequent results (rank penalty)
+    return np.maximum(60.0, scores - np.arange(len(names)) * 5.0)
+
+
+@disk_cached("bioportal")
+async def fetch_case_matches_async(query: str, max_results: int = 5):
     """Search BioPortal API for ICD/SNOMED/MeSH terms related to query."""
     if not BIOPORTAL_API_KEY:
         # Dev fallback without external call
@@ -62,23 +65,32 @@ def fetch_case_matches(query: str, max_results: int = 5):
         "pagesize": max_results,
     }
     try:
-        response = requests.get(BIOPORTAL_API_URL, params=params, timeout=10)
+        response = await get_http_client().get(BIOPORTAL_API_URL, params=params)
         response.raise_for_status()
+        data = orjson.loads(response.content)
+    except httpx.TimeoutException:
+        print("❌ Error fetching BioPortal results: request timed out")
+        return []
     except Exception as e:
         print(f"❌ Error fetching BioPortal results: {e}")
         return []
-
-    data = response.json()
     
+    collection = data.get("collection", [])
+
+    # Score every prefLabel against the query in one batch instead of N Python calls
+    names = [item.get("prefLabel", "Unknown") for item in collection]
+    final_scores = _batch_match_scores(query, names, [item.get("matchType", "") for item in collection]) if names else []
+
     results = []
-    for idx, item in enumerate(data.get("collection", [])):
-        # Extract code from @id URL (e.g., SNOMEDCT/73211009 or ICD10CM/E11)
-        code_id = item.get("@id", "")
-        code = code_id.split("/")[-1] if code_id else "N/A"
-        
-        # Try to get the ontology source (SNOMEDCT, ICD10CM, etc.)
-        ontology_link = item.get("links", {}).get("ontology", "")
-        ontology_source = ontology_link.split("/")[-1] if ontology_link else "Unknown"
+    for idx, item in enumerate(collection):
+        # Ontology source and code from the @id URL (e.g., SNOMEDCT/73211009 or ICD10CM/E11)
+        m = _ID_RE.search(item.get("@id", ""))
+        if m:
+            ontology_source, code = m.groups()
+        else:
+            # Non-purl @id: fall back to the ontology link
+            ontology_source = item.get("links", {}).get("ontology", "").rpartition("/")[2] or "Unknown"
+            code = item.get("@id", "").rpartition("/")[2] or "N/A"
         
         # Get definition - it might be a string or list
         definition = item.get("definition")
@@ -91,25 +103,21 @@ def fetch_case_matches(query: str, max_results: int = 5):
             synonyms = item.get("synonym", [])
             description = synonyms[0] if synonyms else "No description available"
         
-        # Calculate match score
-        match_type = item.get("matchType", "")
-        result_name = item.get("prefLabel", "Unknown")
-        match_score = calculate_match_score(query, result_name, match_type)
-        
-        # Reduce score for subsequent results (rank penalty)
-        rank_penalty = idx * 5.0
-        final_score = max(60.0, match_score - rank_penalty)
-        
         results.append({
             "icd_code": f"{ontology_source}:{code}",  # e.g., "SNOMEDCT:73211009"
-            "name": result_name,
+            "name": names[idx],
             "description": description,
-            "score": round(final_score, 1),  # Now a meaningful percentage
+            "score": round(float(final_scores[idx]), 1),  # Now a meaningful percentage
             "cui": item.get("cui", ["N/A"])[0] if item.get("cui") else "N/A",
         })
 
     return results[:max_results]
 
+
+def fetch_case_matches(query: str, max_results: int = 5):
+    """Sync wrapper around fetch_case_matches_async."""
+    return run_sync(fetch_case_matches_async(query, max_results))
+
 # -------------------------------
 # LangChain LLM Setup
 # -------------------------------
@@ -130,44 +138,43 @@ def _get_llm():
         temperature=0.2,
         api_key=api_key,
         base_url="https://openrouter.ai/api/v1",
+        timeout=60,
+        max_retries=2,
     )
     return _llm
 
 # Prompt for refinement
-matcher_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are a clinical case matcher AI.
+SYSTEM_PROMPT = """You are a clinical case matcher AI.
 Given ontology results, pick the **top 3 most relevant matches**.
 Return STRICT JSON in this schema:
-{{
+{
   "matched_cases": [
-    {{"icd_code": "string", "name": "string", "description": "string", "match_score": float}}
+    {"icd_code": "string", "name": "string", "description": "string", "match_score": float}
   ]
-}}"""),   # 👈 Escaped curly braces
-    ("user", "Ontology results:\n{results}")
-])
+}"""
+USER_TEMPLATE = "Ontology results:\n{results}"
+
+_system_msg = SystemMessage(content=SYSTEM_PROMPT)
 
 # -------------------------------
-# Agent Function
+# Query / Result Helpers (shared with the combined research agent)
 # -------------------------------
-def case_matcher_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    """LangGraph node for Case Matcher Agent (BioPortal + LLM refinement)."""
-    symptoms = (state.get("symptoms") or "").strip()
-    diagnosis = (state.get("diagnosis") or "").strip()
-    age = (state.get("age") or "").__str__().strip()
-    gender = (state.get("gender") or "").strip()
-    medical_history = (state.get("medicalHistory") or state.get("history") or "").strip()
+def build_case_query(state: Dict[str, Any]) -> str:
+    """Build a focused BioPortal query - prioritize diagnosis, then symptoms."""
+    ctx = patient_context(state)
 
-    # Build a focused query - prioritize diagnosis, then symptoms
     # Don't make it too long or it won't match anything in BioPortal
-    if diagnosis:
-        query = diagnosis
-    elif symptoms:
+    if ctx.diagnosis:
+        return ctx.diagnosis
+    if ctx.symptoms:
         # Take first few symptoms only
-        symptom_list = symptoms.split(",")[:2]
-        query = ", ".join(symptom_list).strip()
-    else:
-        query = ""
-    
+        symptom_list = ctx.symptoms.split(",")[:2]
+        return ", ".join(symptom_list).strip()
+    return ""
+
+
+def set_case_matcher_result(state: Dict[str, Any], query: str, raw_results: list, parsed: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Write state["case_matcher"]; without an LLM result the top 3 BioPortal hits pass through."""
     if not query:
         state["case_matcher"] = {
             "matched_cases": [],
@@ -175,14 +182,6 @@ def case_matcher_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         }
         return state
 
-    raw_results = fetch_case_matches(query)
-    
-    # Debug output
-    print(f"🔍 Case Matcher Query: {query}")
-    print(f"📊 BioPortal returned {len(raw_results)} results")
-    if raw_results:
-        print(f"First result: {raw_results[0]}")
-
     if not raw_results:
         state["case_matcher"] = {
             "matched_cases": [],
@@ -190,17 +189,6 @@ def case_matcher_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         }
         return state
 
-    # Send ontology results to LLM for ranking & selection
-    parsed = None
-    try:
-        llm = _get_llm()
-        if llm is not None:
-            chain = matcher_prompt | llm
-            result = chain.invoke({"results": json.dumps(raw_results, indent=2)})
-            parsed = json.loads((result.content or "").strip())
-    except Exception as e:
-        print(f"❌ Case matcher LLM error: {e}")
-        parsed = None
     if parsed is None:
         # Simple passthrough of top 3 with basic mapping
         parsed = {
@@ -215,18 +203,57 @@ def case_matcher_agent(state: Dict[str, Any]) -> Dict[str, Any]:
             ]
         }
 
+    ctx = patient_context(state)
     state["case_matcher"] = {
         "query": query,
         "matched_cases": parsed.get("matched_cases", []),
         "patient_context": {
-            "age": age,
-            "gender": gender,
-            "medical_history": medical_history,
+            "age": ctx.age,
+            "gender": ctx.gender,
+            "medical_history": ctx.medical_history,
         },
         "disclaimer": "Ontology matches are retrieved via BioPortal (ICD/SNOMED/MeSH) and AI-refined. Verify clinically."
     }
     return state
 
+# -------------------------------
+# Agent Function
+# -------------------------------
+async def case_matcher_agent_async(state: Dict[str, Any]) -> Dict[str, Any]:
+    """LangGraph node for Case Matcher Agent (BioPortal + LLM refinement)."""
+    query = build_case_query(state)
+    if not query:
+        return set_case_matcher_result(state, query, [])
+
+    raw_results = await fetch_case_matches_async(query)
+    
+    # Debug output
+    print(f"🔍 Case Matcher Query: {query}")
+    print(f"📊 BioPortal returned {len(raw_results)} results")
+    if raw_results:
+        print(f"First result: {raw_results[0]}")
+
+    # Send ontology results to LLM for ranking & selection; with <= 3 hits
+    # there is nothing to select, so the passthrough is used as-is
+    parsed = None
+    if len(raw_results) > LLM_RANK_MIN_RESULTS:
+        try:
+            llm = _get_llm()
+            if llm is not None:
+                result = await llm.ainvoke(build_messages(_system_msg, USER_TEMPLATE, results=orjson.dumps(raw_results).decode()))
+                parsed = orjson.loads(result.content or "")
+        except Exception as e:
+            print(f"❌ Case matcher LLM error: {e}")
+            parsed = None
+            mark_degraded(state, "case_matcher")
+
+    return set_case_matcher_result(state, query, raw_results, parsed)
+
+
+def case_matcher_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Sync wrapper so the agent can still be used as a plain LangGraph node."""
+    return run_sync(case_matcher_agent_async(state))
+
 # -------------------------------
 # Build Graph (standalone version)
 # -------------------------------
@@ -1,14 +1,21 @@
 import os
-import json
-import requests
+import io
+import orjson
+import httpx
 from typing import Dict, Any
 from dotenv import load_dotenv
-from xml.etree import ElementTree as ET
+from lxml import etree
 
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from langgraph.graph import StateGraph, END
 
+from backend.utils.http_client import get_http_client, run_sync
+from backend.utils.patient_context import patient_context
+from backend.utils.response_cache import disk_cached
+from backend.utils.degraded import mark_degraded
+from backend.utils.prompts import build_messages
+
 # Load environment variables
 load_dotenv()
 
@@ -19,18 +26,51 @@ PUBMED_FETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
 # -------------------------------
 # PubMed Fetch Function
 # -------------------------------
-def fetch_pubmed_articles(query: str, max_results: int = 3):
-    """Fetch top PubMed articles with full abstracts."""
+# Direct paths from <PubmedArticle> (known schema), compiled once instead of
+# a recursive .// descent per lookup
+_PMID_XPATH = etree.XPath("MedlineCitation/PMID/text()", smart_strings=False)
+# Elements, not text(): titles/abstracts contain inline markup (<i>, <sup>, ...)
+_TITLE_XPATH = etree.XPath("MedlineCitation/Article/ArticleTitle")
+_ABSTRACT_XPATH = etree.XPath("MedlineCitation/Article/Abstract/AbstractText")
+
+
+def _element_text(el) -> str:
+    """All text inside an element, including text within inline markup."""
+    return "".join(el.itertext())
+
+
+def _parse_article(article) -> Dict[str, Any]:
+    pmid = _PMID_XPATH(article)
+    title = _TITLE_XPATH(article)
+    pmid = pmid[0] if pmid else None
+    title = _element_text(title[0]) if title else "No title"
+    abstract_texts = [text for text in map(_element_text, _ABSTRACT_XPATH(article)) if text]
+
+    abstract = " ".join(abstract_texts).strip()
+    return {
+        "pmid": pmid,
+        "title": title,
+        "abstract": abstract
+    }
+
+
+@disk_cached("pubmed")
+async def fetch_pubmed_articles_async(query: str, max_results: int = 3):
+    """Fetch top PubMed articles with full abstracts (esearch → efetch)."""
     params = {
         "db": "pubmed",
         "term": query,
         "retmode": "json",
         "retmax": max_results
     }
+    client = get_http_client()
     try:
-        search_resp = requests.get(PUBMED_SEARCH_URL, params=params, timeout=10)
+        search_resp = await client.get(PUBMED_SEARCH_URL, params=params)
         search_resp.raise_for_status()
-        search_data = search_resp.json()
+        search_data = orjson.loads(search_resp.content)
+    except httpx.TimeoutException:
+        print("❌ PubMed search error: request timed out")
+        return []
     except Exception as e:
         print(f"❌ PubMed search error: {e}")
         return []
@@ -44,29 +84,35 @@ def fetch_pubmed_articles(query: str, max_results: int = 3):
         "id": ",".join(id_list),
         "retmode": "xml"
     }
+    results = []
     try:
-        fetch_resp = requests.get(PUBMED_FETCH_URL, params=fetch_params, timeout=10)
-        fetch_resp.raise_for_status()
-        root = ET.fromstring(fetch_resp.text)
+        # Stream the XML into lxml's pull parser as bytes arrive: no full decode
+        # to str and no full tree, each article is freed once extracted
+        parser = etree.XMLPullParser(events=("end",), tag="PubmedArticle", resolve_entities=False, no_network=True)
+        async with client.stream("GET", PUBMED_FETCH_URL, params=fetch_params) as fetch_resp:
+            fetch_resp.raise_for_status()
+            async for chunk in fetch_resp.aiter_bytes():
+                parser.feed(chunk)
+                for _, article in parser.read_events():
+                    results.append(_parse_article(article))
+                    article.clear()
+                    while article.getprevious() is not None:
+                        del article.getparent()[0]
+        parser.close()
+    except httpx.TimeoutException:
+        print("❌ PubMed fetch error: request timed out")
+        return []
     except Exception as e:
         print(f"❌ PubMed fetch error: {e}")
         return []
 
-    results = []
-    for article in root.findall(".//PubmedArticle"):
-        pmid = article.findtext(".//PMID")
-        title = article.findtext(".//ArticleTitle", default="No title")
-        abstract_texts = [ab.text for ab in article.findall(".//AbstractText") if ab.text]
-
-        abstract = " ".join(abstract_texts).strip()
-        results.append({
-            "pmid": pmid,
-            "title": title,
-            "abstract": abstract
-        })
-
     return results[:max_results]
 
+
+def fetch_pubmed_articles(query: str, max_results: int = 3):
+    """Sync wrapper around fetch_pubmed_articles_async."""
+    return run_sync(fetch_pubmed_articles_async(query, max_results))
+
 # -------------------------------
 # LangChain LLM Setup
 # -------------------------------
@@ -87,36 +133,31 @@ def _get_llm():
         temperature=0.3,
         api_key=api_key,
         base_url="https://openrouter.ai/api/v1",
+        timeout=60,
+        max_retries=2,
     )
     return _llm
 
 # Prompt template for summarizing PubMed abstracts
-summary_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are a medical research summarizer.
+SYSTEM_PROMPT = """You are a medical research summarizer.
 Summarize each abstract into ≤70 words.
 Return STRICT JSON as:
-{{
+{
   "summaries": [
-    {{"pmid": "string", "title": "string", "summary": "string"}}
+    {"pmid": "string", "title": "string", "summary": "string"}
   ]
-}}"""),
-    ("user", "Abstracts:\n{abstracts}")
-])
+}"""
+USER_TEMPLATE = "Abstracts:\n{abstracts}"
+
+_system_msg = SystemMessage(content=SYSTEM_PROMPT)
 
 # -------------------------------
-# Agent Function
+# Query / Result Helpers (shared with the combined research agent)
 # -------------------------------
-def literature_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    """LangGraph node for Literature Agent (PubMed + LLM summarizer).
-
-    Builds a more specific PubMed query using patient context to improve personalization.
-    """
-    symptoms = (state.get("symptoms") or "").strip()
-    diagnosis = (state.get("diagnosis") or "").strip()
-    age = (state.get("age") or "").__str__().strip()
-    gender = (state.get("gender") or "").strip()
-    medical_history = (state.get("medicalHistory") or state.get("history") or "").strip()
-    current_meds = (state.get("currentMedications") or "").strip()
+def build_literature_query(state: Dict[str, Any]) -> str:
+    """Build a more specific PubMed query using patient context to improve personalization."""
+    ctx = patient_context(state)
+    symptoms, diagnosis, age = ctx.symptoms, ctx.diagnosis, ctx.age
 
     # Construct targeted PubMed query
     # Use diagnosis as primary query, or symptoms if no diagnosis
@@ -135,14 +176,22 @@ def literature_agent(state: Dict[str, Any]) -> Dict[str, Any]:
             query_parts.append(symptoms)
     
     # Join with AND for reasonable specificity (max 2-3 terms)
-    query = " AND ".join(query_parts[:3]) if query_parts else symptoms or "general medicine"
+    return " AND ".join(query_parts[:3]) if query_parts else symptoms or "general medicine"
 
-    print(f"🔍 Literature Agent Query: {query}")
-    
-    articles = fetch_pubmed_articles(query)
-    
-    print(f"📚 PubMed returned {len(articles)} articles")
 
+def format_abstracts(articles: list) -> str:
+    """Prepare abstracts as LLM input."""
+    # Write straight into one buffer instead of building a list of strings to join
+    buf = io.StringIO()
+    for i, a in enumerate(articles):
+        if i:
+            buf.write("\n\n")
+        buf.write(f"PMID: {a['pmid']}\nTitle: {a['title']}\nAbstract: {a['abstract']}")
+    return buf.getvalue()
+
+
+def set_literature_result(state: Dict[str, Any], query: str, articles: list, parsed: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Write state["literature"]; without an LLM result, abstracts are truncated as summaries."""
     if not articles:
         state["literature"] = {
             "query": query,
@@ -151,22 +200,6 @@ def literature_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         }
         return state
 
-    # Prepare abstracts as input
-    abstracts_text = "\n\n".join(
-        [f"PMID: {a['pmid']}\nTitle: {a['title']}\nAbstract: {a['abstract']}" for a in articles]
-    )
-
-    # If LLM unavailable or fails, provide minimal summaries from abstracts
-    parsed = None
-    try:
-        llm = _get_llm()
-        if llm is not None:
-            chain = summary_prompt | llm
-            result = chain.invoke({"abstracts": abstracts_text})
-            parsed = json.loads((result.content or "").strip())
-    except Exception as e:
-        print(f"❌ Literature summarizer error: {e}")
-        parsed = None
     if parsed is None:
         parsed = {
             "summaries": [
@@ -179,19 +212,53 @@ def literature_agent(state: Dict[str, Any]) -> Dict[str, Any]:
             ]
         }
 
+    ctx = patient_context(state)
     state["literature"] = {
         "query": query,
         "articles": parsed,
         "patient_context": {
-            "age": age,
-            "gender": gender,
-            "medical_history": medical_history,
-            "current_medications": current_meds,
+            "age": ctx.age,
+            "gender": ctx.gender,
+            "medical_history": ctx.medical_history,
+            "current_medications": ctx.current_medications,
         },
         "disclaimer": "These references are from PubMed and AI-summarized; verify with a professional."
     }
     return state
 
+# -------------------------------
+# Agent Function
+# -------------------------------
+async def literature_agent_async(state: Dict[str, Any]) -> Dict[str, Any]:
+    """LangGraph node for Literature Agent (PubMed + LLM summarizer)."""
+    query = build_literature_query(state)
+
+    print(f"🔍 Literature Agent Query: {query}")
+    
+    articles = await fetch_pubmed_articles_async(query)
+    
+    print(f"📚 PubMed returned {len(articles)} articles")
+
+    # If LLM unavailable or fails, provide minimal summaries from abstracts
+    parsed = None
+    if articles:
+        try:
+            llm = _get_llm()
+            if llm is not None:
+                result = await llm.ainvoke(build_messages(_system_msg, USER_TEMPLATE, abstracts=format_abstracts(articles)))
+                parsed = orjson.loads(result.content or "")
+        except Exception as e:
+            print(f"❌ Literature summarizer error: {e}")
+            parsed = None
+            mark_degraded(state, "literature")
+
+    return set_literature_result(state, query, articles, parsed)
+
+
+def literature_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Sync wrapper so the agent can still be used as a plain LangGraph node."""
+    return run_sync(literature_agent_async(state))
+
 # -------------------------------
 # Build Graph (standalone version)
 # -------------------------------
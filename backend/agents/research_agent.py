@@ -0,0 +1,242 @@
+import os
+import asyncio
+import ijson
+import logging
+import orjson
+from typing import Dict, Any
+from dotenv import load_dotenv
+
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage
+from langgraph.config import get_stream_writer
+from langgraph.graph import StateGraph, END
+
+from backend.agents.case_matcher import LLM_RANK_MIN_RESULTS, build_case_query, fetch_case_matches_async, set_case_matcher_result
+from backend.agents.literature_agent import build_literature_query, fetch_pubmed_articles_async, format_abstracts, set_literature_result
+from backend.agents.treatment_agent import treatment_condition, patient_prompt_inputs, enrich_with_rxnorm, set_treatment_result
+from backend.utils.http_client import run_sync
+from backend.utils.degraded import mark_degraded
+from backend.utils.prompts import build_messages
+
+# -------------------------------
+# Env & LLM
+# -------------------------------
+load_dotenv()
+
+logger = logging.getLogger("medsai")
+
+_llm = None
+
+
+def _get_llm():
+    global _llm
+    if _llm is not None:
+        return _llm
+
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return None
+
+    _llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0.2,
+        api_key=api_key,
+        base_url="https://openrouter.ai/api/v1",
+        timeout=60,
+        max_retries=2,
+    )
+    return _llm
+
+# -------------------------------
+# Prompt (case matching + literature + treatment in ONE call)
+# -------------------------------
+SYSTEM_PROMPT = """You are a clinical research assistant completing three tasks in one pass.
+1. Case matching: from the ontology results, pick the **top 3 most relevant matches**.
+2. Literature: summarize each abstract into ≤70 words.
+3. Treatment: for the condition, suggest BOTH drug and non-drug interventions. For drugs, include specific medication names.
+   Incorporate patient context (age, gender, medical history, current medications) to note contraindications, interactions, and tailoring.
+If a task has no input ("None"), return an empty list for it.
+Return STRICT JSON in this schema:
+{
+  "matched_cases": [
+    {"icd_code": "string", "name": "string", "description": "string", "match_score": float}
+  ],
+  "summaries": [
+    {"pmid": "string", "title": "string", "summary": "string"}
+  ],
+  "treatments": [
+    {"name": "string", "class": "string", "type": "drug/non-drug", "rationale": "string", "source": "string"}
+  ]
+}"""
+USER_TEMPLATE = "Condition: {condition}\nAge: {age}\nGender: {gender}\nMedical History: {medical_history}\nCurrent Medications: {current_meds}\n\nOntology results:\n{results}\n\nAbstracts:\n{abstracts}"
+
+_system_msg = SystemMessage(content=SYSTEM_PROMPT)
+
+
+SECTIONS = ("matched_cases", "summaries", "treatments")
+
+
+async def _astream_json(llm, messages: list, on_item) -> Dict[str, Any]:
+    """Stream the LLM reply and report each section item as soon as its JSON is complete.
+
+    A single ijson parser builds the reply object while on_item(section, item)
+    fires for each finished item, so the returned result is exactly what was
+    streamed. Text before the first "{" (e.g. a code fence) and anything after
+    the closing brace is ignored. If the reply is not valid JSON, the outermost
+    {...} is parsed once at the end instead; if it was cut off, the sections
+    that did close are kept.
+    """
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events, use_float=True)
+    builder = ijson.ObjectBuilder()
+    items = {f"{key}.item": key for key in SECTIONS}
+    closed = set()
+    buffer = []
+    started = done = False
+    incremental = True
+    async for chunk in llm.astream(messages):
+        text = chunk.content or ""
+        buffer.append(text)
+        if done or not incremental:
+            continue
+        if not started:
+            brace = text.find("{")
+            if brace < 0:
+                continue
+            text, started = text[brace:], True
+        try:
+            parser.send(text.encode())
+        except ijson.JSONError:
+            incremental = False
+            continue
+        for prefix, event, value in events:
+            builder.event(event, value)
+            key = items.get(prefix)
+            if key is not None and event not in ("start_map", "start_array", "map_key"):
+                on_item(key, builder.value[key][-1])
+            elif prefix in SECTIONS and event == "end_array":
+                closed.add(prefix)
+            elif prefix == "" and event == "end_map":
+                # Top-level object closed; stop before trailing prose trips the parser
+                done = True
+                break
+        del events[:]
+    if done:
+        return builder.value
+    # Not clean JSON (or truncated): fall back to the outermost {...} of the full reply
+    reply = "".join(buffer)
+    try:
+        return orjson.loads(reply[reply.find("{"):reply.rfind("}") + 1])
+    except orjson.JSONDecodeError:
+        if not (incremental and closed):
+            raise
+        return {key: builder.value[key] for key in closed}
+
+
+def _section(parsed: Dict[str, Any], key: str):
+    """One task's slice of the combined response, or None so that agent's fallback applies."""
+    if not isinstance(parsed, dict) or not isinstance(parsed.get(key), list):
+        return None
+    return {key: parsed[key]}
+
+# -------------------------------
+# Agent Function
+# -------------------------------
+async def research_agent_async(state: Dict[str, Any], on_item=None) -> Dict[str, Any]:
+    """LangGraph node: case matcher + literature + treatment with a single LLM round trip.
+
+    BioPortal and PubMed are queried concurrently, then one prompt ranks the
+    matches, summarizes the abstracts and proposes treatments. RxNorm lookups
+    for the suggested drugs run afterwards, concurrently. The reply is streamed;
+    on_item(section, item) is called as each item completes.
+    """
+    case_query = build_case_query(state)
+    lit_query = build_literature_query(state)
+    condition = treatment_condition(state)
+
+    logger.debug("🔍 Case Matcher Query: %s", case_query)
+    logger.debug("🔍 Literature Agent Query: %s", lit_query)
+
+    async def _no_matches():
+        return []
+
+    raw_results, articles = await asyncio.gather(
+        fetch_case_matches_async(case_query) if case_query else _no_matches(),
+        fetch_pubmed_articles_async(lit_query),
+    )
+
+    logger.debug("📊 BioPortal returned %d results", len(raw_results))
+    logger.debug("📚 PubMed returned %d articles", len(articles))
+
+    # Few enough ontology hits pass straight through; keep them out of the prompt
+    rank_cases = len(raw_results) > LLM_RANK_MIN_RESULTS
+
+    parsed = None
+    drug_results = []
+    llm = None
+    try:
+        llm = _get_llm()
+        if llm is not None:
+            messages = build_messages(
+                _system_msg,
+                USER_TEMPLATE,
+                condition=condition or "None",
+                **patient_prompt_inputs(state),
+                results=orjson.dumps(raw_results).decode() if rank_cases else "None",
+                abstracts=format_abstracts(articles) if articles else "None",
+            )
+            parsed = await _astream_json(llm, messages, on_item or (lambda section, item: None))
+    except Exception:
+        logger.exception("❌ Research LLM error")
+        parsed = None
+
+    if llm is not None:
+        # Tasks sent to the LLM without a usable answer take their fallback
+        for key, section, asked in (
+            ("matched_cases", "case_matcher", rank_cases),
+            ("summaries", "literature", bool(articles)),
+            ("treatments", "treatment", bool(condition)),
+        ):
+            if asked and _section(parsed, key) is None:
+                mark_degraded(state, section)
+
+    treatment = _section(parsed, "treatments")
+    if condition and treatment:
+        try:
+            await enrich_with_rxnorm(treatment["treatments"], drug_results)
+        except Exception:
+            logger.exception("❌ RxNorm enrichment error")
+            treatment = None
+            mark_degraded(state, "treatment")
+
+    set_case_matcher_result(state, case_query, raw_results, _section(parsed, "matched_cases") if rank_cases else None)
+    set_literature_result(state, lit_query, articles, _section(parsed, "summaries"))
+    set_treatment_result(state, condition, treatment, drug_results)
+    return state
+
+
+def research_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Sync wrapper so the agent can still be used as a plain LangGraph node.
+
+    Partial items are forwarded to LangGraph's custom stream (stream_mode="custom").
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        writer = None  # called outside a graph run
+
+    def on_item(section, item):
+        if writer is not None:
+            writer({"agent": "research_agent", "section": section, "item": item})
+
+    return run_sync(research_agent_async(state, on_item))
+
+# -------------------------------
+# Build Graph (standalone)
+# -------------------------------
+def build_research_graph():
+    graph = StateGraph(dict)
+    graph.add_node("research_agent", research_agent)
+    graph.set_entry_point("research_agent")
+    graph.add_edge("research_agent", END)
+    return graph.compile()
@@ -1,12 +1,15 @@
 import os
-import json
+import orjson
 from typing import Dict, Any, List
 from dotenv import load_dotenv
 
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from langgraph.graph import StateGraph, END
 
+from backend.utils.degraded import mark_degraded
+from backend.utils.prompts import build_messages
+
 # -------------------------------
 # Env & LLM
 # -------------------------------
@@ -29,6 +32,8 @@ def _get_llm():
         temperature=0.2,
         api_key=api_key,
         base_url="https://openrouter.ai/api/v1",
+        timeout=60,
+        max_retries=2,
     )
     return _llm
 
@@ -107,26 +112,25 @@ def _extract_inputs(state: Dict[str, Any]) -> Dict[str, Any]:
 # -------------------------------
 # Prompt (STRICT JSON)
 # -------------------------------
-summary_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are a medical report summarizer. 
+SYSTEM_PROMPT = """You are a medical report summarizer. 
 You will receive patient context and outputs from multiple agents (differentials, literature, case matches, and treatments).
 Write two concise summaries and recommended next steps.
 
 Return STRICT JSON ONLY in this schema:
-{{
-  "summary": {{
+{
+  "summary": {
     "patient_summary": "string", 
     "clinical_summary": "string",
     "recommendations": [
-      {{"type": "next_steps", "content": "string"}}
+      {"type": "next_steps", "content": "string"}
     ],
-    "citations": {{
+    "citations": {
       "pmids": ["string"],
       "sources": ["string"]
-    }}
-  }},
+    }
+  },
   "disclaimer": "This is AI-generated and not medical advice."
-}}
+}
 
 Guidance:
 - patient_summary: plain language, ≤ 150 words.
@@ -134,9 +138,10 @@ Guidance:
 - recommendations: 2–4 items, actionable (tests, referrals, monitoring, red flags).
 - citations.pmids: collect PMIDs from literature if present (unique, ≤ 5).
 - citations.sources: include recognizable guideline sources if present in treatments (e.g., ADA, NICE), ≤ 5.
-"""),
-    ("user", "Patient & Agent Outputs:\n{payload_json}")
-])
+"""
+USER_TEMPLATE = "Patient & Agent Outputs:\n{payload_json}"
+
+_system_msg = SystemMessage(content=SYSTEM_PROMPT)
 
 # -------------------------------
 # Agent node
@@ -164,15 +169,17 @@ def summarizer_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     try:
         llm = _get_llm()
         if llm is not None:
-            chain = summary_prompt | llm
-            result = chain.invoke({
-                "payload_json": json.dumps(payload, indent=2, ensure_ascii=False)
-            })
+            result = llm.invoke(build_messages(
+                _system_msg,
+                USER_TEMPLATE,
+                payload_json=orjson.dumps(payload).decode()
+            ))
             raw = (result.content or "").strip()
-            parsed = json.loads(raw)
+            parsed = orjson.loads(raw)
     except Exception as e:
         print(f"❌ Summarizer LLM error: {e}")
         parsed = None
+        mark_degraded(state, "summary")
 
     if parsed is None:
         # Simple deterministic summary for dev mode
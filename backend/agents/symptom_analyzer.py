@@ -1,12 +1,15 @@
 import os
-import json
+import orjson
 from typing import Dict, Any
 from dotenv import load_dotenv
 
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from langgraph.graph import StateGraph, END   # ✅ works in 0.6.7
 
+from backend.utils.degraded import mark_degraded
+from backend.utils.prompts import build_messages
+
 # Load environment variables
 load_dotenv()
 
@@ -30,31 +33,33 @@ def _get_llm():
         temperature=0.2,
         api_key=api_key,
         base_url="https://openrouter.ai/api/v1",
+        timeout=60,
+        max_retries=2,
     )
     return _llm
 
 # -------------------------------
 # Prompt Template (with ICD-10-CM India requirement)
 # -------------------------------
-prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a medical reasoning assistant.
+SYSTEM_PROMPT = """You are a medical reasoning assistant.
 For each differential diagnosis, return the official ICD-10-CM (India edition) code along with rationale.
 
 Return STRICT JSON only in this schema:
-{{
+{
     "top_differentials": [
-        {{
+        {
             "name": "string",
             "rationale": "string",
             "icd10cm_code": "string"
-        }}
+        }
     ],
     "risk_level": "low|moderate|high",
     "disclaimer": "This is AI-generated and not medical advice."
-}}
-"""),
-        ("user", "Patient input:\nSymptoms: {symptoms}\nAge: {age}\nGender: {gender}\nMedical History: {medicalHistory}\nCurrent Medications: {currentMedications}\nUrgency: {urgency}")
-])
+}
+"""
+USER_TEMPLATE = "Patient input:\nSymptoms: {symptoms}\nAge: {age}\nGender: {gender}\nMedical History: {medicalHistory}\nCurrent Medications: {currentMedications}\nUrgency: {urgency}"
+
+_system_msg = SystemMessage(content=SYSTEM_PROMPT)
 
 # -------------------------------
 # Agent Function
@@ -72,23 +77,26 @@ def symptom_analyzer_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         return state
 
     try:
-        chain = prompt | llm
-        result = chain.invoke({
-            "symptoms": state.get("symptoms", ""),
-            "age": state.get("age", ""),
+        result = llm.invoke(build_messages(
+            _system_msg,
+            USER_TEMPLATE,
+            symptoms=state.get("symptoms", ""),
+            age=state.get("age", ""),
             # Back-compat: prefer medicalHistory, fallback to history
-            "medicalHistory": state.get("medicalHistory", state.get("history", "")),
-            "gender": state.get("gender", ""),
-            "currentMedications": state.get("currentMedications", ""),
-            "urgency": state.get("urgency", ""),
-        })
+            medicalHistory=state.get("medicalHistory", state.get("history", "")),
+            gender=state.get("gender", ""),
+            currentMedications=state.get("currentMedications", ""),
+            urgency=state.get("urgency", ""),
+        ))
 
         raw_content = (result.content or "").strip()
         try:
-            parsed = json.loads(raw_content)
-        except json.JSONDecodeError:
+            parsed = orjson.loads(raw_content)
+        except orjson.JSONDecodeError:
             parsed = {"raw_output": raw_content}
+            mark_degraded(state, "symptom_analysis")
     except Exception as e:
+        mark_degraded(state, "symptom_analysis")
         parsed = {
             "top_differentials": [],
             "risk_level": "low",
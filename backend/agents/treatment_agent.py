@@ -1,57 +1,50 @@
 import os
-import json
-import requests
+import orjson
+import asyncio
+import httpx
 from typing import Dict, Any
 from dotenv import load_dotenv
-import socket
 
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from langgraph.graph import StateGraph, END
 
+from backend.utils.http_client import get_http_client, run_sync
+from backend.utils.patient_context import patient_context
+from backend.utils.response_cache import disk_cached
+from backend.utils.degraded import mark_degraded
+from backend.utils.prompts import build_messages
+
 # -------------------------------
 # Load environment
 # -------------------------------
 load_dotenv()
 
 RXNORM_API = "https://rxnav.nlm.nih.gov/REST/drugs.json"
-
-# Fix for IPv6/DNS issues - force IPv4
-original_getaddrinfo = socket.getaddrinfo
-
-def getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
-    """Force IPv4 resolution to avoid IPv6 connectivity issues"""
-    return original_getaddrinfo(host, port, socket.AF_INET, type, proto, flags)
-
-# Apply IPv4 fix
-socket.getaddrinfo = getaddrinfo_ipv4_only
+RXNORM_HEADERS = {
+    'User-Agent': 'MedsAI/1.0',
+    'Accept': 'application/json'
+}
 
 # -------------------------------
 # Fetch drugs from RxNorm
 # -------------------------------
-def fetch_drug_treatments(query: str, max_results: int = 5):
+@disk_cached("rxnorm")
+async def fetch_drug_treatments_async(query: str, max_results: int = 5):
     """Query RxNorm API to fetch drug treatments for a condition or drug name."""
     
-    # Try multiple times with different configurations
+    # Try multiple times before giving up
     for attempt in range(2):
         try:
-            # Configure session with specific settings
-            session = requests.Session()
-            session.verify = True  # Enable SSL verification
-            
-            # Longer timeout and explicit IPv4
-            response = session.get(
-                RXNORM_API, 
-                params={"name": query}, 
+            response = await get_http_client().get(
+                RXNORM_API,
+                params={"name": query},
                 timeout=15,  # Increased timeout
-                headers={
-                    'User-Agent': 'MedsAI/1.0',
-                    'Accept': 'application/json'
-                }
+                headers=RXNORM_HEADERS,
             )
             response.raise_for_status()
-            
-            data = response.json()
+            data = orjson.loads(response.content)
+
             results = []
             for group in data.get("drugGroup", {}).get("conceptGroup", []):
                 for concept in group.get("conceptProperties", []) or []:
@@ -68,14 +61,11 @@ def fetch_drug_treatments(query: str, max_results: int = 5):
             
             return results[:max_results]
             
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             print(f"⚠️  RxNorm API timeout on attempt {attempt + 1}/2")
             if attempt == 1:
                 return []
-        except requests.exceptions.SSLError as e:
-            print(f"⚠️  RxNorm SSL error: {str(e)[:100]}")
-            return []
-        except requests.exceptions.ConnectionError as e:
+        except httpx.ConnectError as e:
             print(f"⚠️  RxNorm connection error on attempt {attempt + 1}/2: {str(e)[:100]}")
             if attempt == 1:
                 return []
@@ -86,6 +76,11 @@ def fetch_drug_treatments(query: str, max_results: int = 5):
     print(f"ℹ️  Continuing with AI-only treatment recommendations...")
     return []
 
+
+def fetch_drug_treatments(query: str, max_results: int = 5):
+    """Sync wrapper around fetch_drug_treatments_async."""
+    return run_sync(fetch_drug_treatments_async(query, max_results))
+
 # -------------------------------
 # LangChain LLM setup
 # -------------------------------
@@ -106,72 +101,72 @@ def _get_llm():
         temperature=0.3,
         api_key=api_key,
         base_url="https://openrouter.ai/api/v1",
+        timeout=60,
+        max_retries=2,
     )
     return _llm
 
 # ✅ Escaped JSON braces inside the system prompt
-treatment_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a medical treatment recommender.
+SYSTEM_PROMPT = """You are a medical treatment recommender.
 Given drug results + condition, suggest BOTH drug and non-drug interventions.
 Incorporate patient context (age, gender, medical history, current medications) to note contraindications, interactions, and tailoring.
 Output STRICT JSON:
-{{
+{
     "treatments": [
-        {{"name": "string", "class": "string", "type": "drug/non-drug", "rationale": "string", "source": "string"}}
+        {"name": "string", "class": "string", "type": "drug/non-drug", "rationale": "string", "source": "string"}
     ]
-}}"""),
-        ("user", "Condition: {condition}\nAge: {age}\nGender: {gender}\nMedical History: {medical_history}\nCurrent Medications: {current_meds}\nDrug Results:\n{results}")
-])
+}"""
+USER_TEMPLATE = "Condition: {condition}\nAge: {age}\nGender: {gender}\nMedical History: {medical_history}\nCurrent Medications: {current_meds}\nDrug Results:\n{results}"
+
+_system_msg = SystemMessage(content=SYSTEM_PROMPT)
 
 # -------------------------------
-# Agent Function
+# Prompt / Result Helpers (shared with the combined research agent)
 # -------------------------------
-def treatment_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    """LangGraph node for Treatment Agent."""
-    query = state.get("diagnosis", "") or state.get("symptoms", "")
+def treatment_condition(state: Dict[str, Any]) -> str:
+    ctx = patient_context(state)
+    return ctx.diagnosis or ctx.symptoms
+
+
+def patient_prompt_inputs(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Patient context fields used by the treatment prompts."""
+    ctx = patient_context(state)
+    return {
+        "age": ctx.age,
+        "gender": ctx.gender,
+        "medical_history": ctx.medical_history,
+        "current_meds": ctx.current_medications,
+    }
+
+
+async def enrich_with_rxnorm(treatments: list, drug_results: list) -> None:
+    """Look up every AI-suggested drug in RxNorm and tag the treatments in place."""
+    drugs = [
+        t for t in treatments
+        if t.get("type") == "drug" and t.get("name")
+    ]
+    names = [t.get("name", "").split()[0] for t in drugs]  # Get first word (drug name)
+    # All lookups are multiplexed over the shared HTTP/2 connection: ~1 RTT instead of k
+    lookups = await asyncio.gather(
+        *[fetch_drug_treatments_async(n, max_results=1) for n in names]
+    )
+    for treatment, rxnorm_data in zip(drugs, lookups):
+        if rxnorm_data:
+            # Enhance with RxNorm data
+            treatment["rxcui"] = rxnorm_data[0].get("rxcui", "N/A")
+            treatment["source"] = "RxNorm + AI"
+            drug_results.extend(rxnorm_data)
+        else:
+            treatment["source"] = "Clinical Guidelines"
+
+
+def set_treatment_result(state: Dict[str, Any], query: str, parsed: Dict[str, Any] = None, drug_results: list = None) -> Dict[str, Any]:
+    """Write state["treatment"], falling back to RxNorm-only or generic guidance without an LLM result."""
     if not query:
         state["treatment"] = {"treatments": [], "disclaimer": "No input provided."}
         return state
 
-    # Step 1: Ask LLM to generate treatment medications for the condition
-    # This gives us drug names to search in RxNorm
-    parsed = None
-    drug_results = []
-    
-    try:
-        llm = _get_llm()
-        if llm is not None:
-            chain = treatment_prompt | llm
-            
-            # First, get AI-generated treatments (which will include medication names)
-            result = chain.invoke({
-                "condition": query,
-                "age": (state.get("age") or ""),
-                "gender": (state.get("gender") or ""),
-                "medical_history": (state.get("medicalHistory") or state.get("history") or ""),
-                "current_meds": (state.get("currentMedications") or ""),
-                "results": f"Generate evidence-based drug and non-drug treatments for {query}. For drugs, include specific medication names."
-            })
-            parsed = json.loads((result.content or "").strip())
-            
-            # Step 2: Extract drug names from AI response and query RxNorm for details
-            if parsed and parsed.get("treatments"):
-                for treatment in parsed.get("treatments", []):
-                    if treatment.get("type") == "drug" and treatment.get("name"):
-                        drug_name = treatment.get("name", "").split()[0]  # Get first word (drug name)
-                        rxnorm_data = fetch_drug_treatments(drug_name, max_results=1)
-                        if rxnorm_data:
-                            # Enhance with RxNorm data
-                            treatment["rxcui"] = rxnorm_data[0].get("rxcui", "N/A")
-                            treatment["source"] = "RxNorm + AI"
-                            drug_results.extend(rxnorm_data)
-                        else:
-                            treatment["source"] = "Clinical Guidelines"
-                            
-    except Exception as e:
-        print(f"❌ Treatment LLM error: {e}")
-        parsed = None
-
+    drug_results = drug_results or []
     if parsed is None:
         # Fallback - if LLM failed, provide basic treatment structure
         if drug_results:
@@ -215,6 +210,49 @@ def treatment_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     }
     return state
 
+# -------------------------------
+# Agent Function
+# -------------------------------
+async def treatment_agent_async(state: Dict[str, Any]) -> Dict[str, Any]:
+    """LangGraph node for Treatment Agent."""
+    query = treatment_condition(state)
+    if not query:
+        return set_treatment_result(state, query)
+
+    # Step 1: Ask LLM to generate treatment medications for the condition
+    # This gives us drug names to search in RxNorm
+    parsed = None
+    drug_results = []
+    
+    try:
+        llm = _get_llm()
+        if llm is not None:
+            # First, get AI-generated treatments (which will include medication names)
+            result = await llm.ainvoke(build_messages(
+                _system_msg,
+                USER_TEMPLATE,
+                condition=query,
+                **patient_prompt_inputs(state),
+                results=f"Generate evidence-based drug and non-drug treatments for {query}. For drugs, include specific medication names."
+            ))
+            parsed = orjson.loads(result.content or "")
+            
+            # Step 2: Extract drug names from AI response and query RxNorm for details
+            if parsed and parsed.get("treatments"):
+                await enrich_with_rxnorm(parsed.get("treatments", []), drug_results)
+                            
+    except Exception as e:
+        print(f"❌ Treatment LLM error: {e}")
+        parsed = None
+        mark_degraded(state, "treatment")
+
+    return set_treatment_result(state, query, parsed, drug_results)
+
+
+def treatment_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Sync wrapper so the agent can still be used as a plain LangGraph node."""
+    return run_sync(treatment_agent_async(state))
+
 # -------------------------------
 # Build Graph (standalone)
 # -------------------------------
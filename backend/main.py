@@ -1,17 +1,49 @@
+import os
+import asyncio
+import logging
+import functools
+import hashlib
+import threading
+import concurrent.futures
+import orjson
+from cachetools import TTLCache
+from arq import create_pool
+from arq.connections import RedisSettings
+from arq.constants import result_key_prefix
+from arq.jobs import Job, JobStatus
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables BEFORE importing agents
 
-from fastapi import FastAPI, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from backend.orchestrator.orchestrator import build_orchestrator_graph
+from backend.orchestrator.orchestrator import build_orchestrator_graph, build_subgraphs
+from backend.utils.degraded import is_degraded
 from backend.utils.pdf_generator import generate_pdf_from_analysis
 
+# -------------------------------
+# Logging (MEDSAI_LOG_LEVEL=DEBUG for per-request PDF details)
+# -------------------------------
+logger = logging.getLogger("medsai")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(os.getenv("MEDSAI_LOG_LEVEL", "INFO").upper())
+
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_SECTIONS = ("patient_info", "symptom_analysis", "literature", "case_matcher", "treatment", "summary")
+
 # -------------------------------
 # Initialize FastAPI and Orchestrator
 # -------------------------------
-app = FastAPI(title="GDHS Multi-Agent API", version="1.0")
+# orjson serializes the (large) analysis state faster than the stdlib encoder
+app = FastAPI(title="GDHS Multi-Agent API", version="1.0", default_response_class=ORJSONResponse)
 
 # CORS for local dev frontends (Vite default 5173, 5174; React 3000)
 app.add_middleware(
@@ -23,7 +55,189 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-graph = build_orchestrator_graph()
+# PDFs are already deflate-compressed internally; gzipping them again only costs CPU
+# SSE events must reach the client as they are produced, not sit in a gzip buffer
+GZIP_EXCLUDED_PATHS = {"/generate-pdf", "/analyze/stream"}
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """GZip responses (the text-heavy analysis JSON) except on GZIP_EXCLUDED_PATHS."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in GZIP_EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(JSONGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+@functools.cache
+def _get_graph():
+    """Compiled orchestrator, built once per process on first use (or via /warmup)."""
+    return build_orchestrator_graph()
+
+
+@functools.cache
+def _get_subgraphs():
+    """Single-agent endpoints run only their agent and its prerequisites."""
+    return build_subgraphs()
+
+
+FULL = "analyze"  # cache name for full orchestrator runs
+
+# graph.invoke blocks for the whole pipeline; run it on a bounded pool so the
+# event loop stays free and concurrent requests don't serialize
+ORCH_WORKERS = int(os.getenv("ORCH_WORKERS", "8"))
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=ORCH_WORKERS, thread_name_prefix="orchestrator")
+# Requests beyond this are rejected with 503 instead of queueing without bound
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "32"))
+_inflight = asyncio.Semaphore(MAX_INFLIGHT)
+
+
+class ServerBusy(Exception):
+    pass
+
+
+async def run_graph(state: dict, compiled=None) -> dict:
+    """Run a graph (default: the orchestrator) on EXECUTOR; raises ServerBusy when MAX_INFLIGHT is reached."""
+    if _inflight.locked():
+        raise ServerBusy()
+    async with _inflight:
+        return await asyncio.get_running_loop().run_in_executor(EXECUTOR, (compiled or _get_graph()).invoke, state)
+
+
+# -------------------------------
+# Result Cache (identical patient inputs reuse the last analysis)
+# -------------------------------
+_result_cache = TTLCache(maxsize=512, ttl=3600)
+_cache_lock = threading.RLock()
+_cache_stats = {"hits": 0, "misses": 0}
+_pending: dict = {}  # (name, key) -> Future of a run already in progress
+
+
+def input_key(state: dict) -> str:
+    """Stable hash of a normalized patient input."""
+    return hashlib.blake2b(orjson.dumps(state, option=orjson.OPT_SORT_KEYS, default=str), digest_size=16).hexdigest()
+
+
+def to_input_state(input_data: "PatientInput") -> dict:
+    """Request model -> graph input, with currentMedications as a comma-separated string."""
+    input_state = input_data.model_dump()
+    if isinstance(input_state.get("currentMedications"), list):
+        input_state["currentMedications"] = ", ".join(input_state["currentMedications"])
+    return input_state
+
+
+def _store_result(cache_key: tuple, final_state: dict):
+    """Cache a final state, unless a section came from an error/fallback path (those are retried)."""
+    if is_degraded(final_state):
+        return
+    with _cache_lock:
+        _result_cache[cache_key] = final_state
+
+
+def _cached_state(key: str, names) -> dict | None:
+    """First cached final state for this input among the given graph names."""
+    with _cache_lock:
+        for name in names:
+            cached = _result_cache.get((name, key))
+            if cached is not None:
+                return cached
+    return None
+
+
+async def run_graph_cached(state: dict, name: str = FULL, key: str | None = None) -> dict:
+    """Run the named graph (FULL or a _get_subgraphs() key), memoized by (name, input_key).
+
+    Concurrent identical requests share one run; if that run is cancelled
+    (its caller went away), the waiters start their own. Cached states are
+    shared between callers and must not be mutated.
+    """
+    key = key or input_key(state)
+    cached = _cached_state(key, [name])
+    with _cache_lock:
+        _cache_stats["hits" if cached is not None else "misses"] += 1
+    if cached is not None:
+        return cached
+
+    while (pending := _pending.get((name, key))) is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise  # this request was cancelled, not the shared run
+        # Shared run abandoned: take over, unless another run finished meanwhile
+        cached = _cached_state(key, [name])
+        if cached is not None:
+            return cached
+    key = (name, key)
+
+    future = asyncio.get_running_loop().create_future()
+    _pending[key] = future
+    try:
+        final_state = await run_graph(state, None if name == FULL else _get_subgraphs()[name])
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        _pending.pop(key, None)
+    _store_result(key, final_state)
+    future.set_result(final_state)
+    return final_state
+
+
+@app.exception_handler(ServerBusy)
+async def server_busy_handler(request, exc):
+    return ORJSONResponse(status_code=503, content={"error": "Server is busy, please retry shortly."})
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    EXECUTOR.shutdown(wait=True)
+
+# -------------------------------
+# Optional Job Queue (REDIS_URL set: /analyze runs on backend.worker)
+# -------------------------------
+REDIS_URL = os.getenv("REDIS_URL")
+# How long /analyze?sync=true waits for a queued job before handing back its job_id
+ANALYZE_SYNC_TIMEOUT = float(os.getenv("ANALYZE_SYNC_TIMEOUT", "120"))
+_arq_pool = None
+
+
+@app.on_event("startup")
+async def connect_queue():
+    global _arq_pool
+    if REDIS_URL:
+        _arq_pool = await create_pool(RedisSettings.from_dsn(REDIS_URL))
+
+
+@app.on_event("shutdown")
+async def close_queue():
+    if _arq_pool is not None:
+        await _arq_pool.aclose()
+
+
+async def enqueue_analysis(input_state: dict, key: str) -> Job:
+    """Queue a full analysis under its input key; identical inputs share one job and its kept result.
+
+    A kept result that failed (error, job timeout) or is degraded is dropped and
+    the job re-queued, so one bad run isn't replayed for the whole keep_result.
+    """
+    job = await _arq_pool.enqueue_job("analyze_job", input_state, _job_id=key)
+    if job is not None:
+        return job
+    # None: that job is already queued, running or finished
+    job = Job(key, _arq_pool)
+    info = await job.result_info()
+    if info is not None and (not info.success or is_degraded(info.result)):
+        await _arq_pool.delete(result_key_prefix + key)
+        job = await _arq_pool.enqueue_job("analyze_job", input_state, _job_id=key) or job
+    return job
 
 # -------------------------------
 # Request & Response Models
@@ -55,21 +269,193 @@ def root():
 # Run Full Orchestrator
 # -------------------------------
 @app.post("/analyze")
-def analyze_patient(input_data: PatientInput):
+async def analyze_patient(input_data: PatientInput, sync: bool = False):
+    """Full analysis. With the job queue enabled this returns a job_id to poll
+    (GET /analyze/{job_id}) unless sync=true; without it, sync is implied.
+    """
     try:
         # Convert to dict and normalize medications
-        input_state = input_data.dict()
-        
-        # Normalize currentMedications: convert list to comma-separated string
-        if isinstance(input_state.get("currentMedications"), list):
-            input_state["currentMedications"] = ", ".join(input_state["currentMedications"])
-        
-        # Pass the structured data to the graph
-        final_state = graph.invoke(input_state)
+        input_state = to_input_state(input_data)
+
+        if _arq_pool is None:
+            # Pass the structured data to the graph (or reuse the cached analysis)
+            final_state = await run_graph_cached(input_state)
+            return final_state
+
+        key = input_key(input_state)
+        job = await enqueue_analysis(input_state, key)
+        if not sync:
+            status = await job.status()
+            return ORJSONResponse(status_code=202, content={"job_id": job.job_id, "status": status.value})
+        try:
+            final_state = await job.result(timeout=ANALYZE_SYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            return ORJSONResponse(status_code=504, content={"error": "Analysis is still running.", "job_id": job.job_id})
+        _store_result((FULL, key), final_state)
         return final_state
+    except ServerBusy:
+        raise
     except Exception as e:
         # Provide a structured error for the frontend (avoid opaque Network Error)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return ORJSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/analyze/{job_id}")
+async def analyze_job_status(job_id: str):
+    """Poll a queued analysis: {job_id, status} until complete, then {job_id, status, result}."""
+    if _arq_pool is None:
+        return ORJSONResponse(status_code=404, content={"error": "Job queue is not enabled (set REDIS_URL)."})
+    job = Job(job_id, _arq_pool)
+    status = await job.status()
+    if status == JobStatus.not_found:
+        return ORJSONResponse(status_code=404, content={"error": "Unknown or expired job_id."})
+    if status != JobStatus.complete:
+        return {"job_id": job_id, "status": status.value}
+
+    info = await job.result_info()
+    if info is None or not info.success:
+        error = str(info.result) if info is not None else "Result expired."
+        return ORJSONResponse(status_code=500, content={"job_id": job_id, "status": "failed", "error": error})
+    # Job ids are input keys, so the per-agent endpoints can reuse this analysis
+    _store_result((FULL, job_id), info.result)
+    return {"job_id": job_id, "status": status.value, "result": info.result}
+
+# -------------------------------
+# Batch Orchestrator
+# -------------------------------
+MAX_BATCH = int(os.getenv("MAX_BATCH", "32"))
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(patients: list[PatientInput]):
+    """Analyze several patients concurrently; results (or {"error": ...}) come back in input order."""
+    if len(patients) > MAX_BATCH:
+        return ORJSONResponse(status_code=413, content={"error": f"At most {MAX_BATCH} patients per batch."})
+
+    # At most one batch item per worker at a time, so a large batch doesn't take every in-flight slot
+    slots = asyncio.Semaphore(ORCH_WORKERS)
+
+    async def one(patient: PatientInput):
+        async with slots:
+            try:
+                return await run_graph_cached(to_input_state(patient))
+            except ServerBusy:
+                return {"error": "Server is busy, please retry shortly."}
+            except Exception as e:
+                logger.exception("❌ Batch analysis error: %s", e)
+                return {"error": str(e)}
+
+    # Identical patients in a batch share one run through the result cache
+    return await asyncio.gather(*(one(p) for p in patients))
+
+# -------------------------------
+# Streamed Orchestrator (Server-Sent Events)
+# -------------------------------
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, default=str) + b"\n\n"
+
+
+def _changed_sections(prev: dict, state: dict) -> dict:
+    """Top-level state keys a node added or changed."""
+    return {k: v for k, v in state.items() if k not in prev or prev[k] != v}
+
+
+@app.post("/analyze/stream")
+async def analyze_patient_stream(input_data: PatientInput):
+    """Progressive /analyze: one SSE event per finished agent, plus research items as they parse.
+
+    Events: "agent" {agent, sections}, "item" {agent, section, item}, "done" {},
+    "error" {error}. The final state is cached like /analyze.
+    """
+    input_state = to_input_state(input_data)
+    key = input_key(input_state)
+    cached = _cached_state(key, [FULL])
+    pending = _pending.get((FULL, key)) if cached is None else None
+    run = None
+    if cached is None and pending is None:
+        # Claim the slot and register the run before the response starts (no await
+        # between check and claim), so overload is shed here and a concurrent
+        # identical /analyze or stream waits on this run instead of starting another
+        if _inflight.locked():
+            raise ServerBusy()
+        await _inflight.acquire()  # returns at once: a slot is free
+        run = asyncio.get_running_loop().create_future()
+        _pending[(FULL, key)] = run
+
+    async def release():
+        """Give back the slot once; from the stream's finally, or the background task if it never ran."""
+        nonlocal run
+        if run is None:
+            return
+        _inflight.release()
+        _pending.pop((FULL, key), None)
+        if not run.done():
+            run.cancel()  # stream abandoned: waiters in run_graph_cached start their own run
+        run = None
+
+    async def event_stream():
+        if run is None:
+            final_state = cached
+            if final_state is None:
+                try:
+                    # Joins the run in progress; starts its own if that one is abandoned
+                    final_state = await run_graph_cached(input_state, FULL, key)
+                except Exception as e:
+                    yield _sse("error", {"error": str(e)})
+                    return
+            yield _sse("agent", {"agent": FULL, "sections": _changed_sections(input_state, final_state)})
+            yield _sse("done", {})
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            # Runs on EXECUTOR; hands (mode, chunk) pairs to the event loop
+            try:
+                for item in _get_graph().stream(dict(input_state), stream_mode=["custom", "updates"]):
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                    if stop.is_set():
+                        break  # client went away; closing the generator stops the graph
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        try:
+            future = loop.run_in_executor(EXECUTOR, produce)
+            state = dict(input_state)
+            try:
+                while (item := await queue.get()) is not done:
+                    mode, chunk = item
+                    if mode == "custom":
+                        yield _sse("item", chunk)
+                    elif mode == "updates":
+                        for agent, new_state in chunk.items():
+                            yield _sse("agent", {"agent": agent, "sections": _changed_sections(state, new_state)})
+                            state = dict(new_state)  # nodes update the state dict in place
+                    else:
+                        logger.exception("❌ Streamed analysis error: %s", chunk, exc_info=chunk)
+                        run.set_exception(chunk)
+                        run.exception()  # mark retrieved when nobody else is waiting
+                        yield _sse("error", {"error": str(chunk)})
+                        return
+                _store_result((FULL, key), state)
+                run.set_result(state)
+                yield _sse("done", {})
+            finally:
+                stop.set()
+                await future
+        finally:
+            await release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release),
+    )
 
 # -------------------------------
 # Generate PDF Endpoint
@@ -78,62 +464,131 @@ def analyze_patient(input_data: PatientInput):
 async def generate_pdf(analysis_data: PdfInput):
     try:
         # Only include sections that are present
-        payload = {k: v for k, v in analysis_data.dict().items() if v is not None}
-        
-        # Debug logging
-        print(f"📄 PDF Request received:")
-        print(f"  - patient_info: {'Present' if payload.get('patient_info') else 'Missing'}")
-        print(f"  - symptom_analysis: {'Present' if payload.get('symptom_analysis') else 'Missing'}")
-        print(f"  - literature: {'Present' if payload.get('literature') else 'Missing'}")
-        print(f"  - case_matcher: {'Present' if payload.get('case_matcher') else 'Missing'}")
-        print(f"  - treatment: {'Present' if payload.get('treatment') else 'Missing'}")
-        print(f"  - summary: {'Present' if payload.get('summary') else 'Missing'}")
+        payload = analysis_data.model_dump(exclude_none=True)
         
+        # Debug logging (skipped entirely unless enabled)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "📄 PDF request: %s",
+                ", ".join(f"{k}={'present' if payload.get(k) else 'missing'}" for k in PDF_SECTIONS),
+            )
+
         if not payload:
-            return JSONResponse(status_code=400, content={"error": "No analysis sections provided for PDF."})
+            return ORJSONResponse(status_code=400, content={"error": "No analysis sections provided for PDF."})
 
-        pdf_bytes = generate_pdf_from_analysis(payload)
-        if isinstance(pdf_bytes, bytearray):
-            pdf_bytes = bytes(pdf_bytes)
+        # Layout is CPU-bound; render off the event loop. Starlette's threadpool, not
+        # EXECUTOR: a ~50 ms render must not queue behind LLM-bound graph runs
+        pdf_buf = await run_in_threadpool(generate_pdf_from_analysis, payload)
+        size = pdf_buf.getbuffer().nbytes
         
-        print(f"✅ PDF generated successfully ({len(pdf_bytes)} bytes)")
-        
-        return Response(
-            content=pdf_bytes,
+        logger.debug("✅ PDF generated (%d bytes)", size)
+
+        # Stream the buffer in fixed-size chunks (iterating BytesIO directly would split on newlines)
+        return StreamingResponse(
+            iter(lambda: pdf_buf.read(PDF_CHUNK_SIZE), b""),
             media_type='application/pdf',
-            headers={'Content-Disposition': 'attachment; filename="analysis_report.pdf"'}
+            headers={
+                'Content-Disposition': 'attachment; filename="analysis_report.pdf"',
+                'Content-Length': str(size),
+            }
         )
     except Exception as e:
-        print(f"❌ PDF generation error: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        logger.exception("❌ PDF generation error: %s", e)
+        return ORJSONResponse(status_code=500, content={"error": str(e)})
+
+# -------------------------------
+# Warm-up (build graphs and exercise the PDF path before real traffic)
+# -------------------------------
+def _warmup():
+    _get_graph()
+    _get_subgraphs()
+    generate_pdf_from_analysis({})
+
+
+@app.post("/warmup")
+async def warmup():
+    await run_in_threadpool(_warmup)
+    return {"status": "warm"}
+
+# -------------------------------
+# Cache Admin (debugging)
+# -------------------------------
+@app.get("/cache/stats")
+async def cache_stats():
+    with _cache_lock:
+        return {
+            "size": len(_result_cache),
+            "maxsize": _result_cache.maxsize,
+            "ttl": _result_cache.ttl,
+            **_cache_stats,
+        }
+
+@app.post("/cache/invalidate")
+async def cache_invalidate(key: str | None = None):
+    """Drop the cached results for one input (?key=<input hash>) or all of them,
+    including finished job results kept by the queue."""
+    with _cache_lock:
+        if key is None:
+            removed = len(_result_cache)
+            _result_cache.clear()
+        else:
+            stale = [k for k in list(_result_cache.keys()) if k[1] == key]
+            for k in stale:
+                _result_cache.pop(k, None)
+            removed = len(stale)
+    if _arq_pool is not None:
+        if key is None:
+            result_keys = [k async for k in _arq_pool.scan_iter(match=result_key_prefix + "*")]
+        else:
+            result_keys = [result_key_prefix + key]
+        if result_keys:
+            removed += await _arq_pool.delete(*result_keys)
+    return {"removed": removed}
 
 # -------------------------------
 # Individual Agents (Optional)
 # -------------------------------
+async def run_agent(input_data: PatientInput, section: str) -> dict:
+    """One agent's section, running only that agent (and symptom analysis) when nothing is cached."""
+    state = to_input_state(input_data)
+    key = input_key(state)
+
+    # A full analysis of the same input already has every section
+    full = _cached_state(key, [FULL])
+    if full is not None:
+        with _cache_lock:
+            _cache_stats["hits"] += 1
+        return full.get(section, {})
+
+    if section != "symptom_analysis":
+        # Reuse a cached symptom analysis; the subgraph then skips that node
+        prior = _cached_state(key, _get_subgraphs())
+        if prior is not None:
+            state["symptom_analysis"] = prior["symptom_analysis"]
+            if "diagnosis" in prior:
+                state["diagnosis"] = prior["diagnosis"]
+
+    final_state = await run_graph_cached(state, section, key)
+    return final_state.get(section, {})
+
 @app.post("/symptom-analyzer")
-def run_symptom_agent(input_data: PatientInput):
-    final_state = graph.invoke(input_data.dict())
-    return final_state.get("symptom_analysis", {})
+async def run_symptom_agent(input_data: PatientInput):
+    return await run_agent(input_data, "symptom_analysis")
 
 @app.post("/literature")
-def run_literature_agent(input_data: PatientInput):
-    final_state = graph.invoke(input_data.dict())
-    return final_state.get("literature", {})
+async def run_literature_agent(input_data: PatientInput):
+    return await run_agent(input_data, "literature")
 
 @app.post("/case-matcher")
-def run_case_matcher(input_data: PatientInput):
-    final_state = graph.invoke(input_data.dict())
-    return final_state.get("case_matcher", {})
+async def run_case_matcher(input_data: PatientInput):
+    return await run_agent(input_data, "case_matcher")
 
 @app.post("/treatment")
-def run_treatment_agent(input_data: PatientInput):
-    final_state = graph.invoke(input_data.dict())
-    return final_state.get("treatment", {})
+async def run_treatment_agent(input_data: PatientInput):
+    return await run_agent(input_data, "treatment")
 
 @app.post("/summary")
-def run_summary_agent(input_data: PatientInput):
-    final_state = graph.invoke(input_data.dict())
+async def run_summary_agent(input_data: PatientInput):
+    final_state = await run_graph_cached(to_input_state(input_data))
     return final_state.get("summary", {})
 
@@ -1,10 +1,10 @@
 # import the libraries form ptcharm 
 
-import json
 from langgraph.graph import StateGraph, END   # ✅ fixed import
 
 # Import agents
 from backend.agents.symptom_analyzer import symptom_analyzer_agent
+from backend.agents.research_agent import research_agent  # literature + case matcher + treatment
 from backend.agents.literature_agent import literature_agent
 from backend.agents.case_matcher import case_matcher_agent
 from backend.agents.treatment_agent import treatment_agent
@@ -18,17 +18,48 @@ def build_orchestrator_graph():
 
     # Add agents as nodes
     graph.add_node("symptom_analyzer", symptom_analyzer_agent)
-    graph.add_node("literature_agent", literature_agent)
-    graph.add_node("case_matcher", case_matcher_agent)
-    graph.add_node("treatment_agent", treatment_agent)
+    graph.add_node("research_agent", research_agent)       # literature + case matcher + treatment, one LLM call
     graph.add_node("summarizer_agent", summarizer_agent)   # ✅ new
 
-    # Flow: Entry → Symptom Analyzer → Literature Agent → Case Matcher → Treatment Agent → Summarizer Agent → End
+    # Flow: Entry → Symptom Analyzer → (Literature | Case Matcher | Treatment) → Summarizer Agent → End
     graph.set_entry_point("symptom_analyzer")
-    graph.add_edge("symptom_analyzer", "literature_agent")
-    graph.add_edge("literature_agent", "case_matcher")
-    graph.add_edge("case_matcher", "treatment_agent")
-    graph.add_edge("treatment_agent", "summarizer_agent")   # ✅ added
+    graph.add_edge("symptom_analyzer", "research_agent")
+    graph.add_edge("research_agent", "summarizer_agent")
     graph.add_edge("summarizer_agent", END)                 # ✅ final step
 
     return graph.compile()
+
+# -------------------------------
+# Per-agent Subgraphs (single-agent endpoints)
+# -------------------------------
+def _agent_after_symptoms(name, agent):
+    """symptom_analyzer -> agent; symptom analysis is skipped when the state already has it."""
+    graph = StateGraph(dict)
+    graph.add_node("symptom_analyzer", symptom_analyzer_agent)
+    graph.add_node(name, agent)
+
+    graph.set_conditional_entry_point(
+        lambda state: name if "symptom_analysis" in state else "symptom_analyzer",
+        ["symptom_analyzer", name],
+    )
+    graph.add_edge("symptom_analyzer", name)
+    graph.add_edge(name, END)
+    return graph.compile()
+
+
+def build_subgraphs():
+    """Graphs with only the target agent plus its prerequisites, keyed by state section.
+
+    The summary needs every agent, so it keeps using build_orchestrator_graph().
+    """
+    graph = StateGraph(dict)
+    graph.add_node("symptom_analyzer", symptom_analyzer_agent)
+    graph.set_entry_point("symptom_analyzer")
+    graph.add_edge("symptom_analyzer", END)
+
+    return {
+        "symptom_analysis": graph.compile(),
+        "literature": _agent_after_symptoms("literature_agent", literature_agent),
+        "case_matcher": _agent_after_symptoms("case_matcher", case_matcher_agent),
+        "treatment": _agent_after_symptoms("treatment_agent", treatment_agent),
+    }
@@ -0,0 +1,19 @@
+from typing import Dict, Any
+
+# -------------------------------
+# Sections filled from error/fallback paths (e.g. a failed LLM call)
+# -------------------------------
+# Such states are still returned, but must not be cached: the failure is
+# usually transient and the next identical request should retry.
+DEGRADED_KEY = "degraded_sections"
+
+
+def mark_degraded(state: Dict[str, Any], section: str) -> None:
+    """Record that state[section] holds placeholder/fallback output."""
+    sections = state.setdefault(DEGRADED_KEY, [])
+    if section not in sections:
+        sections.append(section)
+
+
+def is_degraded(state: Dict[str, Any]) -> bool:
+    return bool(state.get(DEGRADED_KEY))
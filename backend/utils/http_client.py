@@ -0,0 +1,62 @@
+import os
+import asyncio
+import threading
+import httpx
+
+# -------------------------------
+# Shared HTTP/2 client for BioPortal, PubMed and RxNorm
+# -------------------------------
+RXNORM_ORIGIN = "https://rxnav.nlm.nih.gov"
+# RxNav has IPv6/DNS issues on some hosts; set RXNORM_FORCE_IPV4=0 where IPv6 works
+RXNORM_FORCE_IPV4 = os.getenv("RXNORM_FORCE_IPV4", "1").lower() not in ("0", "false", "no")
+
+_LIMITS = httpx.Limits(max_keepalive_connections=16)
+
+_client = None
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Long-lived event loop (own thread) that all agent I/O runs on.
+
+    Keeping one loop lets pooled connections (ours and the LLM client's)
+    be reused across requests instead of dying with each asyncio.run().
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="medsai-io", daemon=True).start()
+    return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared I/O loop and block until it finishes."""
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from the I/O loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Module-level AsyncClient with HTTP/2 keep-alive (use from the I/O loop)."""
+    global _client
+    if _client is None:
+        mounts = {}
+        if RXNORM_FORCE_IPV4:
+            # Binding to 0.0.0.0 makes this transport resolve/connect over IPv4 only.
+            # Scoped to the RxNav origin: other APIs and the LLM client are unaffected.
+            mounts[RXNORM_ORIGIN] = httpx.AsyncHTTPTransport(http2=True, limits=_LIMITS, local_address="0.0.0.0")
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=10.0,
+            limits=_LIMITS,
+            mounts=mounts,
+        )
+    return _client
@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from typing import Dict, Any
+
+# -------------------------------
+# Normalized patient context shared by the agents
+# -------------------------------
+@dataclass(slots=True)
+class PatientCtx:
+    symptoms: str
+    diagnosis: str
+    age: str
+    gender: str
+    medical_history: str
+    current_medications: str
+    urgency: str
+
+
+def _text(value) -> str:
+    return str(value).strip() if value else ""
+
+
+def patient_context(state: Dict[str, Any]) -> PatientCtx:
+    """Read the patient fields from graph state as stripped strings ("" when missing)."""
+    return PatientCtx(
+        symptoms=_text(state.get("symptoms")),
+        diagnosis=_text(state.get("diagnosis")),
+        age=_text(state.get("age")),
+        gender=_text(state.get("gender")),
+        # Back-compat: prefer medicalHistory, fallback to history
+        medical_history=_text(state.get("medicalHistory") or state.get("history")),
+        current_medications=_text(state.get("currentMedications")),
+        urgency=_text(state.get("urgency")),
+    )
@@ -1,4 +1,10 @@
+import io
+import re
+import functools
+import numpy as np
 from fpdf import FPDF
+from fpdf.drawing import convert_to_device_color
+from fpdf.enums import XPos, YPos
 from typing import Any, Dict, List
 from datetime import datetime
 
@@ -19,6 +25,54 @@ PAL = {
     "wm_text": (130, 138, 145),   # watermark subtitle
 }
 
+RISK_COLORS = {"HIGH": PAL["bad"], "MEDIUM": PAL["warn"], "LOW": PAL["ok"]}
+RISK_CONFIDENCE = {"high": 85, "medium": 70, "low": 50}
+
+WM_TITLE = "MedsAI"
+WM_SUBTITLE = "AI-Powered Clinical Decision Support"  # ASCII only
+
+# -----------------------------
+# Diagnostic workup by primary dx keyword
+# -----------------------------
+TESTS_ENDO = (
+    "Fasting Blood Glucose (FBG)",
+    "HbA1c (long-term glycemic control)",
+    "Gastric emptying study if gastroparesis suspected",
+    "Upper GI endoscopy to rule out obstruction",
+    "CBC and CMP baseline",
+)
+TESTS_CARDIO = (
+    "12-lead ECG",
+    "High-sensitivity troponin",
+    "Chest X-ray",
+    "Echocardiogram",
+    "Fasting lipid profile",
+)
+TESTS_NEURO = (
+    "Focused neurological examination",
+    "CT/MRI brain if red flags",
+    "Blood pressure trend",
+    "Vision assessment",
+)
+TESTS_DEFAULT = (
+    "CBC, CMP baseline",
+    "Urinalysis",
+    "Condition-specific imaging/labs per clinical picture",
+)
+# Checked in order, so a dx naming several categories keeps the first one's tests
+_WORKUP_RULES = (
+    (re.compile(r"diabetes|gastroparesis", re.I), TESTS_ENDO),
+    (re.compile(r"cardiac|myocardial|coronary|acs", re.I), TESTS_CARDIO),
+    (re.compile(r"migraine|headache", re.I), TESTS_NEURO),
+)
+
+def workup_tests(primary_dx_name: str) -> tuple:
+    dx = primary_dx_name or ""
+    for pattern, tests in _WORKUP_RULES:
+        if pattern.search(dx):
+            return tests
+    return TESTS_DEFAULT
+
 # -----------------------------
 # Helpers
 # -----------------------------
@@ -31,8 +85,25 @@ def pct_text(p) -> str:
     except Exception:
         return "0%"
 
-def safe_str(v: Any, max_token_len: int = 60) -> str:
-    s = "" if v is None else str(v)
+MAX_TOKEN_LEN = 60
+# Anything the split/re-join below would change: an over-long token, whitespace
+# other than single inner spaces. Most labels/values match none of it.
+_NEEDS_SPLIT = re.compile(rf"\S{{{MAX_TOKEN_LEN + 1},}}|[^\S ]|  |^ | $")
+
+def safe_str(v: Any, max_token_len: int = MAX_TOKEN_LEN) -> str:
+    s = "" if v is None else v if isinstance(v, str) else str(v)
+    if max_token_len == MAX_TOKEN_LEN:
+        return _safe_text(s)
+    return _split_long_tokens(s, max_token_len)
+
+@functools.lru_cache(maxsize=1024)
+def _safe_text(s: str) -> str:
+    # Same labels recur in every report; fast path returns the input as-is
+    if not _NEEDS_SPLIT.search(s):
+        return s
+    return _split_long_tokens(s, MAX_TOKEN_LEN)
+
+def _split_long_tokens(s: str, max_token_len: int) -> str:
     out = []
     for tok in s.split():
         if len(tok) > max_token_len:
@@ -45,6 +116,40 @@ def safe_str(v: Any, max_token_len: int = 60) -> str:
         return " ".join(s[i:i + max_token_len] for i in range(0, len(s), max_token_len))
     return s
 
+# Paragraphs at least this long are wrapped with NumPy; below it the
+# array setup costs more than the Python loop
+NP_WRAP_MIN_CHARS = 200
+
+_cw_tables: Dict[str, Any] = {}
+
+def _char_widths(font):
+    """Latin-1 glyph widths (font units) for a core font as an int array, or None."""
+    cw = getattr(font, "cw", None)
+    if not isinstance(cw, dict):
+        return None
+    table = _cw_tables.get(font.fontkey)
+    if table is None:
+        table = _cw_tables[font.fontkey] = np.array([cw.get(chr(i), 0) for i in range(256)], dtype=np.int64)
+    return table
+
+@functools.lru_cache(maxsize=None)
+def _device_color(r, g=-1, b=-1):
+    """convert_to_device_color, memoized: the report only uses a handful of colors."""
+    return convert_to_device_color(r, g, b)
+
+# Styles the report uses; width tables for them are built at import so the
+# first report in a process doesn't pay for it
+REPORT_FONT_STYLES = ("", "B", "I")
+
+def _warm_fonts():
+    pdf = FPDF()
+    pdf.add_page()
+    for style in REPORT_FONT_STYLES:
+        pdf.set_font("Helvetica", style, 10)
+        _char_widths(pdf.current_font)
+
+_warm_fonts()
+
 # -----------------------------
 # PDF class
 # -----------------------------
@@ -61,10 +166,52 @@ class MedsAIReport(FPDF):
         self.row_gap = 2.0
         self.line_h = 5.0
 
+        # (family, style, size_pt, text) -> width; words/labels repeat a lot
+        self._width_cache: Dict[tuple, float] = {}
+
+        # Watermark layout is identical on every page; measured on the first one
+        self._wm_layout: Dict[str, tuple] = {}
+
+    # ---- graphics state ----
+    # The block helpers set colors/fonts defensively before almost every cell.
+    # Compare against FPDF's own state (which add_page also restores) and skip
+    # the conversion/normalization work when nothing changes.
+    def set_text_color(self, r, g=-1, b=-1):
+        self.text_color = _device_color(r, g, b)
+
+    def set_fill_color(self, r, g=-1, b=-1):
+        color = _device_color(r, g, b)
+        if color != self.fill_color:
+            super().set_fill_color(color)
+
+    def set_draw_color(self, r, g=-1, b=-1):
+        color = _device_color(r, g, b)
+        if color != self.draw_color:
+            super().set_draw_color(color)
+
+    def set_font(self, family=None, style="", size=0):
+        if (
+            not self.underline
+            and style == self.font_style
+            and size == self.font_size_pt
+            and family
+            and family.lower() == self.font_family
+        ):
+            return
+        super().set_font(family, style, size)
+
     # ---- utilities ----
     def _cw(self) -> float:
         return self.w - self.l_margin - self.r_margin
 
+    def _text_width(self, text: str) -> float:
+        """get_string_width with the current font, memoized per report."""
+        key = (self.font_family, self.font_style, self.font_size_pt, text)
+        width = self._width_cache.get(key)
+        if width is None:
+            width = self._width_cache[key] = self.get_string_width(text)
+        return width
+
     def ensure_space(self, needed: float):
         """Prevent orphaned headers/cards at page bottom."""
         if self.get_y() + needed > self.page_break_trigger:
@@ -85,18 +232,55 @@ class MedsAIReport(FPDF):
             if not part:
                 lines += 1
                 continue
-            words = part.split(" ")
-            cur = ""
-            for word in words:
-                test = (cur + " " + word).strip()
-                if self.get_string_width(test) <= w:
-                    cur = test
-                else:
-                    lines += 1
-                    cur = word
-            lines += 1 if cur else 0
+            counted = self._nb_lines_np(w, part) if len(part) >= NP_WRAP_MIN_CHARS else None
+            lines += counted if counted is not None else self._nb_lines_py(w, part)
         return max(1, lines)
 
+    def _nb_lines_py(self, w: float, part: str) -> int:
+        # Greedy fill using per-word widths (core fonts have no kerning,
+        # so width("a b") == width("a") + width(" ") + width("b"))
+        space_w = self._text_width(" ")
+        lines = 0
+        cur_w = None
+        for word in part.split(" "):
+            word_w = self._text_width(word)
+            test_w = word_w if cur_w is None else cur_w + space_w + word_w
+            if test_w <= w:
+                cur_w = test_w
+            else:
+                lines += 1
+                cur_w = word_w
+        return lines + (1 if cur_w is not None else 0)
+
+    def _nb_lines_np(self, w: float, part: str):
+        """Same greedy count as _nb_lines_py on cumulative word widths; None if not applicable."""
+        if part[0] == " " or part[-1] == " " or "  " in part:
+            return None  # empty words; leave to the Python path
+        try:
+            codes = np.frombuffer((part + " ").encode("latin-1"), dtype=np.uint8)
+        except UnicodeEncodeError:
+            return None
+        table = _char_widths(self.current_font)
+        if table is None:
+            return None
+        # Each segment is one word plus its trailing space, in font units
+        starts = np.flatnonzero(codes == 32)[:-1] + 1
+        seg = np.add.reduceat(table[codes], np.concatenate(([0], starts)))
+        cum = np.concatenate(([0], np.cumsum(seg)))
+        space = int(table[32])
+        limit = w / (self.font_size_pt * 0.001 / self.k) + space
+
+        n = len(seg)
+        # A first word wider than the line is counted once more, as in the loop
+        lines = 1 if seg[0] > limit else 0
+        i = 0
+        while i < n:
+            # Furthest end j with width(words i..j-1) = cum[j] - cum[i] - space <= w
+            j = int(np.searchsorted(cum, cum[i] + limit, side="right")) - 1
+            i = max(j, i + 1)
+            lines += 1
+        return lines
+
     # ------- aligned label/value row -------
     def kv_row(self, label: str, value: str, lab_w: float = 40, fs: int = 10, draw_line: bool = False):
         """
@@ -109,21 +293,25 @@ class MedsAIReport(FPDF):
         val_w = self._cw() - lab_w
 
         # Compute height needed for the value block (lines * line_h)
-        self.set_font("Arial", "", fs)
-        val_lines = self._nb_lines(val_w, value, fs)
+        self.set_font("Helvetica", "", fs)
+        text = safe_str(value or "")
+        if "\n" not in text and self._text_width(text) <= val_w:
+            val_lines = 1  # common case: the whole value fits, no need to walk words
+        else:
+            val_lines = self._nb_lines(val_w, value, fs)
         row_h = max(self.line_h, val_lines * self.line_h)
 
         # Draw label cell (fixed width, full row height)
-        self.set_font("Arial", "B", fs)
+        self.set_font("Helvetica", "B", fs)
         self.set_text_color(*PAL["muted"])
         self.set_xy(x0, y0)
         self.cell(lab_w, row_h, safe_str(label), border=0, align="L")
 
         # Draw value cell as MultiCell to wrap
-        self.set_font("Arial", "", fs)
+        self.set_font("Helvetica", "", fs)
         self.set_text_color(*PAL["ink"])
         self.set_xy(x0 + lab_w, y0)
-        self.multi_cell(val_w, self.line_h, safe_str(value), border=0, align="L")
+        self.multi_cell(val_w, self.line_h, text, border=0, align="L")
 
         # Optionally underline the row for tight tables
         if draw_line:
@@ -135,7 +323,7 @@ class MedsAIReport(FPDF):
 
     # ---- simple bullet list (ASCII only) ----
     def bullet_list(self, items: List[str], indent: float = 3, fs: int = 10):
-        self.set_font("Arial", "", fs)
+        self.set_font("Helvetica", "", fs)
         for it in items or []:
             self.set_x(self.l_margin + indent)
             self.multi_cell(self._cw() - indent, self.line_h, f"- {safe_str(it)}")
@@ -146,35 +334,41 @@ class MedsAIReport(FPDF):
         self.set_fill_color(*PAL["chip"])
         self.set_draw_color(*PAL["line"])
         self.set_text_color(40, 55, 80)
-        self.set_font("Arial", "B", 9)
-        w = self.get_string_width(text) + 8
-        self.cell(w, 6, text, 1, 0, "C", True)
+        self.set_font("Helvetica", "B", 9)
+        w = self._text_width(text) + 8
+        self.cell(w, 6, text, border=1, align="C", fill=True)
         self.set_text_color(*PAL["ink"])
 
     def pct_pill(self, pct: float, risk: str = "HIGH"):
-        self.set_font("Arial", "B", 12)
-        color = {"HIGH": PAL["bad"], "MEDIUM": PAL["warn"], "LOW": PAL["ok"]}.get(str(risk).upper(), PAL["ok"])
+        self.set_font("Helvetica", "B", 12)
+        color = RISK_COLORS.get(str(risk).upper(), PAL["ok"])
         self.set_text_color(*color)
-        self.cell(0, 6, f"{pct_text(pct)} {str(risk).upper()}", 0, 1, "R")
+        self.cell(0, 6, f"{pct_text(pct)} {str(risk).upper()}", align="R", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         self.set_text_color(*PAL["ink"])
 
     # ---- watermark ----
+    def _wm_position(self, text: str):
+        """Centered (x, width) of a watermark line in the current font, measured once per report."""
+        pos = self._wm_layout.get(text)
+        if pos is None:
+            w = self._text_width(text)
+            pos = self._wm_layout[text] = ((self.w - w) / 2, w)
+        return pos
+
     def _draw_watermark(self):
         cur_x, cur_y = self.get_x(), self.get_y()
         # Title
         self.set_text_color(*PAL["wm_light"])
-        self.set_font("Arial", "B", 46)
-        wm_text = "MedsAI"
-        w = self.get_string_width(wm_text)
-        self.set_xy((self.w - w) / 2, self.h * 0.45)
-        self.cell(w, 12, wm_text, 0, 1, "C")
-        # Subtitle (ASCII only)
+        self.set_font("Helvetica", "B", 46)
+        title_x, title_w = self._wm_position(WM_TITLE)
+        self.set_xy(title_x, self.h * 0.45)
+        self.cell(title_w, 12, WM_TITLE, align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        # Subtitle
         self.set_text_color(*PAL["wm_text"])
-        self.set_font("Arial", "", 11)
-        sub = "AI-Powered Clinical Decision Support"
-        ws = self.get_string_width(sub)
-        self.set_x((self.w - ws) / 2)
-        self.cell(ws, 6, sub, 0, 1, "C")
+        self.set_font("Helvetica", "", 11)
+        sub_x, sub_w = self._wm_position(WM_SUBTITLE)
+        self.set_x(sub_x)
+        self.cell(sub_w, 6, WM_SUBTITLE, align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         # restore
         self.set_text_color(*PAL["ink"])
         self.set_xy(cur_x, cur_y)
@@ -186,12 +380,12 @@ class MedsAIReport(FPDF):
         self.rect(0, 0, self.w, 24, "F")
         self.set_y(5)
         self.set_text_color(255, 255, 255)
-        self.set_font("Arial", "B", 15)
-        self.cell(0, 7, "MedsAI Diagnostic Report", 0, 1, "C")
-        self.set_font("Arial", "", 9)
-        self.cell(0, 5, "Comprehensive AI-Driven Medical Analysis", 0, 1, "C")
+        self.set_font("Helvetica", "B", 15)
+        self.cell(0, 7, "MedsAI Diagnostic Report", align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_font("Helvetica", "", 9)
+        self.cell(0, 5, "Comprehensive AI-Driven Medical Analysis", align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         dt = datetime.now().strftime("%B %d, %Y - %I:%M %p")  # ASCII only
-        self.cell(0, 5, f"Generated: {dt}", 0, 1, "C")
+        self.cell(0, 5, f"Generated: {dt}", align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         self.ln(3)
         # Watermark behind content
         self._draw_watermark()
@@ -203,11 +397,11 @@ class MedsAIReport(FPDF):
         self.set_line_width(0.2)
         self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
         self.ln(2)
-        self.set_font("Arial", "I", 8)
+        self.set_font("Helvetica", "I", 8)
         self.set_text_color(140, 140, 140)
-        self.cell(0, 5, "Generated by MedsAI Diagnostic System", 0, 1, "C")
-        self.set_font("Arial", "", 9)
-        self.cell(0, 5, f"Page {self.page_no()}/{{nb}}", 0, 0, "C")
+        self.cell(0, 5, "Generated by MedsAI Diagnostic System", align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_font("Helvetica", "", 9)
+        self.cell(0, 5, f"Page {self.page_no()}/{{nb}}", align="C")
         self.set_text_color(*PAL["ink"])
 
     # ---- section / card ----
@@ -217,7 +411,7 @@ class MedsAIReport(FPDF):
         self.set_draw_color(180, 190, 210)
         y = self.get_y()
         self.rect(self.l_margin, y, self._cw(), 8, "DF")
-        self.set_font("Arial", "B", 11)
+        self.set_font("Helvetica", "B", 11)
         self.set_text_color(30, 58, 138)
         self.set_xy(self.l_margin + 2, y + 2)
         self.cell(0, 4, title)
@@ -254,13 +448,13 @@ class MedsAIReport(FPDF):
         if data.get("currentMedications"):
             meds = data["currentMedications"]
             meds_list = meds if isinstance(meds, list) else [str(meds)]
-            self.set_font("Arial", "B", 10)
-            self.cell(0, 6, "Current Medications", 0, 1)
+            self.set_font("Helvetica", "B", 10)
+            self.cell(0, 6, "Current Medications", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
             self.bullet_list([safe_str(m) for m in meds_list], indent=4, fs=9)
         if data.get("primary_complaint"):
-            self.set_font("Arial", "B", 10)
-            self.cell(0, 6, "Primary Complaint", 0, 1)
-            self.set_font("Arial", "", 10)
+            self.set_font("Helvetica", "B", 10)
+            self.cell(0, 6, "Primary Complaint", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 10)
             self.multi_cell(self._cw(), self.line_h, safe_str(data["primary_complaint"]))
             self.ln(self.row_gap)
 
@@ -289,7 +483,7 @@ class MedsAIReport(FPDF):
         diffs = symptom_analysis.get("top_differentials", [])
         risk = str(symptom_analysis.get("risk_level", "medium")).lower()
         if not diffs:
-            self.set_font("Arial", "", 10)
+            self.set_font("Helvetica", "", 10)
             self.multi_cell(self._cw(), self.line_h, "No differential diagnoses available.")
             return
 
@@ -299,29 +493,29 @@ class MedsAIReport(FPDF):
         name = d0.get("name", "Unknown")
         icd = d0.get("icd10cm_code", "N/A")
         rationale = d0.get("rationale", "No rationale provided.")
-        conf = {"high": 85, "medium": 70, "low": 50}.get(risk, 70)
+        conf = RISK_CONFIDENCE.get(risk, 70)
 
-        self.set_font("Arial", "B", 11)
-        self.cell(0, 6, f"Primary Diagnosis: {name}", 0, 1)
-        self.set_font("Arial", "", 9)
-        self.cell(0, 5, f"ICD-10: {icd}", 0, 1)
+        self.set_font("Helvetica", "B", 11)
+        self.cell(0, 6, f"Primary Diagnosis: {name}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_font("Helvetica", "", 9)
+        self.cell(0, 5, f"ICD-10: {icd}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         self.ln(1)
-        self.set_font("Arial", "B", 10)
-        self.cell(0, 6, "Diagnostic Confidence:", 0, 1)
+        self.set_font("Helvetica", "B", 10)
+        self.cell(0, 6, "Diagnostic Confidence:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         self.pct_pill(conf, risk.upper())
-        self.set_font("Arial", "B", 10)
-        self.cell(0, 6, "Clinical Reasoning:", 0, 1)
-        self.set_font("Arial", "", 10)
+        self.set_font("Helvetica", "B", 10)
+        self.cell(0, 6, "Clinical Reasoning:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_font("Helvetica", "", 10)
         self.multi_cell(self._cw(), self.line_h, safe_str(rationale))
         self.end_card(start, 2)
 
         # Alternatives
         if len(diffs) > 1:
-            self.set_font("Arial", "B", 10)
-            self.cell(0, 6, "Alternative Diagnoses to Consider:", 0, 1)
-            self.set_font("Arial", "", 9)
+            self.set_font("Helvetica", "B", 10)
+            self.cell(0, 6, "Alternative Diagnoses to Consider:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 9)
             for i, d in enumerate(diffs[1:], 2):
-                self.cell(0, 5, f"{i}. {d.get('name','Unknown')} - {d.get('icd10cm_code','N/A')}", 0, 1)
+                self.cell(0, 5, f"{i}. {d.get('name','Unknown')} - {d.get('icd10cm_code','N/A')}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
                 if d.get("rationale"):
                     self.set_x(self.l_margin + 3)
                     self.multi_cell(self._cw() - 3, 4, safe_str(d["rationale"]))
@@ -329,38 +523,9 @@ class MedsAIReport(FPDF):
 
     def block_workup(self, primary_dx_name: str):
         self.section("Recommended Diagnostic Workup")
-        dx = (primary_dx_name or "").lower()
-        if any(k in dx for k in ("diabetes", "gastroparesis")):
-            tests = [
-                "Fasting Blood Glucose (FBG)",
-                "HbA1c (long-term glycemic control)",
-                "Gastric emptying study if gastroparesis suspected",
-                "Upper GI endoscopy to rule out obstruction",
-                "CBC and CMP baseline",
-            ]
-        elif any(k in dx for k in ("cardiac", "myocardial", "coronary", "acs")):
-            tests = [
-                "12-lead ECG",
-                "High-sensitivity troponin",
-                "Chest X-ray",
-                "Echocardiogram",
-                "Fasting lipid profile",
-            ]
-        elif any(k in dx for k in ("migraine", "headache")):
-            tests = [
-                "Focused neurological examination",
-                "CT/MRI brain if red flags",
-                "Blood pressure trend",
-                "Vision assessment",
-            ]
-        else:
-            tests = [
-                "CBC, CMP baseline",
-                "Urinalysis",
-                "Condition-specific imaging/labs per clinical picture",
-            ]
-        self.set_font("Arial", "B", 10)
-        self.cell(0, 6, "Recommended Laboratory & Imaging Studies", 0, 1)
+        tests = workup_tests(primary_dx_name)
+        self.set_font("Helvetica", "B", 10)
+        self.cell(0, 6, "Recommended Laboratory & Imaging Studies", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         self.bullet_list(tests, indent=4, fs=9)
 
     def block_treatment(self, treatment: Dict[str, Any]):
@@ -369,33 +534,33 @@ class MedsAIReport(FPDF):
         self.section("Treatment Plan")
         items = treatment.get("treatments", [])
         if not items:
-            self.set_font("Arial", "", 10)
+            self.set_font("Helvetica", "", 10)
             self.multi_cell(self._cw(), self.line_h, "No treatment suggestions available.")
             return
         drugs = [t for t in items if t.get("type") == "drug"]
         non = [t for t in items if t.get("type") != "drug"]
 
         if drugs:
-            self.set_font("Arial", "B", 11)
-            self.cell(0, 7, "Pharmacological Interventions:", 0, 1)
+            self.set_font("Helvetica", "B", 11)
+            self.cell(0, 7, "Pharmacological Interventions:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
             for i, t in enumerate(drugs, 1):
-                self.set_font("Arial", "B", 10)
-                self.cell(0, 6, f"{i}. {t.get('name','-')} ({t.get('class','N/A')})", 0, 1)
-                self.set_font("Arial", "", 9)
+                self.set_font("Helvetica", "B", 10)
+                self.cell(0, 6, f"{i}. {t.get('name','-')} ({t.get('class','N/A')})", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+                self.set_font("Helvetica", "", 9)
                 if t.get("rationale"):
                     self.set_x(self.l_margin + 3)
                     self.multi_cell(self._cw() - 3, 5, f"Rationale: {safe_str(t['rationale'])}")
                 if t.get("source"):
                     self.set_x(self.l_margin + 3)
                     self.set_text_color(100, 100, 100)
-                    self.cell(0, 4, f"Source: {safe_str(t['source'])}", 0, 1)
+                    self.cell(0, 4, f"Source: {safe_str(t['source'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
                     self.set_text_color(*PAL["ink"])
                 self.ln(1)
 
         if non:
-            self.set_font("Arial", "B", 11)
-            self.cell(0, 7, "Lifestyle & Non-Pharmacological Interventions:", 0, 1)
-            self.set_font("Arial", "", 9)
+            self.set_font("Helvetica", "B", 11)
+            self.cell(0, 7, "Lifestyle & Non-Pharmacological Interventions:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 9)
             self.bullet_list([f"{t.get('name','-')}: {safe_str(t.get('rationale',''))}".strip(": ")
                                for t in non], indent=4, fs=9)
 
@@ -406,20 +571,20 @@ class MedsAIReport(FPDF):
         arts = literature.get("articles", {})
         summaries = arts.get("summaries", []) if isinstance(arts, dict) else []
         if not summaries:
-            self.set_font("Arial", "I", 9)
-            self.cell(0, 5, "No relevant literature found for this condition.", 0, 1)
+            self.set_font("Helvetica", "I", 9)
+            self.cell(0, 5, "No relevant literature found for this condition.", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
             return
         for i, a in enumerate(summaries[:5], 1):
-            self.set_font("Arial", "B", 9)
-            self.cell(0, 5, f"[{i}] {safe_str(a.get('title','No title'))}", 0, 1)
-            self.set_font("Arial", "", 8)
+            self.set_font("Helvetica", "B", 9)
+            self.cell(0, 5, f"[{i}] {safe_str(a.get('title','No title'))}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 8)
             self.set_text_color(100, 100, 100)
             pmid = a.get("pmid")
             if pmid:
-                self.cell(0, 4, f"PMID: {safe_str(pmid)}", 0, 1)
+                self.cell(0, 4, f"PMID: {safe_str(pmid)}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
             self.set_text_color(*PAL["ink"])
             self.set_x(self.l_margin + 3)
-            self.set_font("Arial", "", 9)
+            self.set_font("Helvetica", "", 9)
             self.multi_cell(self._cw() - 3, 4, safe_str(a.get("summary", "")))
             self.ln(2)
 
@@ -428,9 +593,9 @@ class MedsAIReport(FPDF):
             return
         self.section("Similar Clinical Cases")
         for i, case in enumerate(case_matcher.get("matched_cases", [])[:3], 1):
-            self.set_font("Arial", "B", 9)
-            self.cell(0, 5, f"{i}. {safe_str(case.get('name','Unknown'))} ({safe_str(case.get('icd_code','N/A'))})", 0, 1)
-            self.set_font("Arial", "", 9)
+            self.set_font("Helvetica", "B", 9)
+            self.cell(0, 5, f"{i}. {safe_str(case.get('name','Unknown'))} ({safe_str(case.get('icd_code','N/A'))})", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 9)
             self.set_x(self.l_margin + 3)
             self.multi_cell(self._cw() - 3, 4, safe_str(case.get("description", "")))
             self.ln(1)
@@ -440,29 +605,29 @@ class MedsAIReport(FPDF):
             return
         self.section("Clinical Summary & Next Steps")
         if summary.get("patient_summary"):
-            self.set_font("Arial", "B", 10)
-            self.cell(0, 6, "Patient Presentation:", 0, 1)
-            self.set_font("Arial", "", 10)
+            self.set_font("Helvetica", "B", 10)
+            self.cell(0, 6, "Patient Presentation:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 10)
             self.multi_cell(self._cw(), self.line_h, safe_str(summary["patient_summary"]))
             self.ln(1)
         if summary.get("clinical_summary"):
-            self.set_font("Arial", "B", 10)
-            self.cell(0, 6, "Clinical Assessment:", 0, 1)
-            self.set_font("Arial", "", 10)
+            self.set_font("Helvetica", "B", 10)
+            self.cell(0, 6, "Clinical Assessment:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 10)
             self.multi_cell(self._cw(), self.line_h, safe_str(summary["clinical_summary"]))
             self.ln(1)
         recs = summary.get("recommendations", [])
         next_steps = [r.get("content", "") for r in recs if r.get("type") == "next_steps"]
         if next_steps:
-            self.set_font("Arial", "B", 10)
-            self.cell(0, 6, "Next Steps & Follow-Up", 0, 1)
-            self.set_font("Arial", "", 9)
+            self.set_font("Helvetica", "B", 10)
+            self.cell(0, 6, "Next Steps & Follow-Up", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_font("Helvetica", "", 9)
             self.bullet_list([safe_str(s) for s in next_steps], indent=4, fs=9)
 
 # -----------------------------
 # Public API (drop-in)
 # -----------------------------
-def generate_pdf_from_analysis(analysis_data: Dict[str, Any]) -> bytes:
+def generate_pdf_from_analysis(analysis_data: Dict[str, Any]) -> io.BytesIO:
     """
     Build a professional, watermark-styled PDF from your analysis_data dict.
     Keys (all optional except patient_info fields you rely on):
@@ -473,6 +638,7 @@ def generate_pdf_from_analysis(analysis_data: Dict[str, Any]) -> bytes:
       - literature: {articles: {summaries: [{title, pmid?, summary}, ...]}}
       - case_matcher: {matched_cases: [{name, icd_code, description}, ...]}
       - summary: {patient_summary?, clinical_summary?, recommendations?: [{type:'next_steps', content}, ...]}
+    Returns the PDF as a BytesIO positioned at the start.
     """
     pdf = MedsAIReport()
     pdf.add_page()
@@ -505,5 +671,7 @@ def generate_pdf_from_analysis(analysis_data: Dict[str, Any]) -> bytes:
     # Summary
     pdf.block_summary(analysis_data.get("summary") or {})
 
-    out = pdf.output(dest="S")
-    return bytes(out) if isinstance(out, (bytes, bytearray)) else out.encode("latin-1")
+    buf = io.BytesIO()
+    pdf.output(buf)
+    buf.seek(0)
+    return buf
@@ -0,0 +1,9 @@
+from langchain_core.messages import SystemMessage, HumanMessage
+
+# -------------------------------
+# Prompt messages shared by the agents
+# -------------------------------
+def build_messages(system_msg: SystemMessage, template: str, **inputs) -> list:
+    """[system, user] chat messages. Agents build their SystemMessage once at import;
+    only the user turn is formatted per call."""
+    return [system_msg, HumanMessage(content=template.format(**inputs))]
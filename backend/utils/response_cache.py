@@ -0,0 +1,112 @@
+import os
+import asyncio
+import hashlib
+import logging
+import orjson
+import time
+import sqlite3
+import inspect
+import threading
+import functools
+from cachetools import TTLCache
+
+# -------------------------------
+# On-disk cache for external API lookups (BioPortal, PubMed, RxNorm)
+# -------------------------------
+# Opt-in: the disk tier is only used when MEDSAI_CACHE_PATH is set. Queries are
+# patient-derived, so only a hash of them is stored as the key.
+CACHE_PATH = os.getenv("MEDSAI_CACHE_PATH") or None
+DEFAULT_TTL = 86400  # 1 day
+# In-process L1 in front of sqlite; shorter TTL so e.g. RxNorm updates show up within the hour
+MEMORY_MAXSIZE = 512
+MEMORY_TTL = 3600
+
+logger = logging.getLogger("medsai")
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        _conn.commit()
+    return _conn
+
+
+def cache_get(namespace: str, key: str):
+    """Return the cached value, or None when missing/expired (or the disk tier is off)."""
+    if CACHE_PATH is None:
+        return None
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT value, expires FROM responses WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+    if row is None or row[1] < time.time():
+        return None
+    return orjson.loads(row[0])
+
+
+def cache_set(namespace: str, key: str, value, ttl: int = DEFAULT_TTL):
+    if CACHE_PATH is None:
+        return
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+            (namespace, key, orjson.dumps(value), time.time() + ttl),
+        )
+        conn.commit()
+
+
+def disk_cached(namespace: str, ttl: int = DEFAULT_TTL):
+    """Cache an async fetcher's results in memory (L1) and on disk (L2, opt-in), keyed by a hash of its call arguments.
+
+    Empty results are not stored: the fetchers return [] on network errors
+    too, and those should be retried next time. L1 hits return the same
+    objects every time, so callers must treat results as read-only. sqlite
+    calls run in a worker thread so they never block the shared I/O loop.
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+        # Fetchers only run on the shared I/O loop thread, so no lock is needed
+        memory = TTLCache(maxsize=MEMORY_MAXSIZE, ttl=min(ttl, MEMORY_TTL))
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()  # so max_results is part of the key even when defaulted
+            key = hashlib.blake2b(
+                orjson.dumps(bound.arguments, option=orjson.OPT_SORT_KEYS, default=str), digest_size=16
+            ).hexdigest()
+            cached = memory.get(key)
+            if cached is not None:
+                return cached
+
+            try:
+                cached = await asyncio.to_thread(cache_get, namespace, key)
+            except Exception as e:
+                logger.warning("⚠️  Cache read error (%s): %s", namespace, e)
+                cached = None
+            if cached is not None:
+                memory[key] = cached
+                return cached
+
+            result = await fn(*args, **kwargs)
+            if result:
+                memory[key] = result
+                try:
+                    await asyncio.to_thread(cache_set, namespace, key, result, ttl)
+                except Exception as e:
+                    logger.warning("⚠️  Cache write error (%s): %s", namespace, e)
+            return result
+
+        wrapper.memory_cache = memory
+        return wrapper
+    return decorator
@@ -0,0 +1,57 @@
+import os
+import asyncio
+import logging
+import concurrent.futures
+from dotenv import load_dotenv
+load_dotenv()  # Load environment variables BEFORE importing agents
+
+from arq.connections import RedisSettings
+from backend.orchestrator.orchestrator import build_orchestrator_graph
+
+# -------------------------------
+# arq worker: runs /analyze jobs outside the API process
+#   arq backend.worker.WorkerSettings
+# -------------------------------
+logger = logging.getLogger("medsai")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(os.getenv("MEDSAI_LOG_LEVEL", "INFO").upper())
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+ORCH_WORKERS = int(os.getenv("ORCH_WORKERS", "8"))
+ANALYZE_JOB_TIMEOUT = int(os.getenv("ANALYZE_JOB_TIMEOUT", "300"))
+# Finished analyses stay fetchable (and identical inputs deduplicated) this long; matches the API result cache
+JOB_RESULT_TTL = 3600
+
+
+async def startup(ctx):
+    ctx["graph"] = build_orchestrator_graph()
+    # graph.invoke blocks (agents wait on the shared I/O loop); keep it off the worker's event loop.
+    # job_timeout cannot stop a running invoke: its thread finishes the current call (bounded by
+    # the agents' LLM/HTTP timeouts), so leave room for those beyond max_jobs
+    ctx["executor"] = concurrent.futures.ThreadPoolExecutor(max_workers=ORCH_WORKERS * 2, thread_name_prefix="orchestrator")
+
+
+async def shutdown(ctx):
+    executor = ctx.get("executor")  # absent if startup never ran (e.g. Redis unreachable)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+async def analyze_job(ctx, input_state: dict) -> dict:
+    """Run the full orchestrator on a normalized patient input (see main.to_input_state)."""
+    logger.info("🧾 Analyze job %s started", ctx["job_id"])
+    return await asyncio.get_running_loop().run_in_executor(ctx["executor"], ctx["graph"].invoke, input_state)
+
+
+class WorkerSettings:
+    functions = [analyze_job]
+    on_startup = startup
+    on_shutdown = shutdown
+    redis_settings = RedisSettings.from_dsn(REDIS_URL)
+    max_jobs = ORCH_WORKERS
+    job_timeout = ANALYZE_JOB_TIMEOUT
+    keep_result = JOB_RESULT_TTL
@@ -57,7 +57,8 @@ export interface AnalysisResult {
 
 // Main analysis endpoint
 export const analyzePatientCase = async (patientData: PatientData) => {
-  const response = await api.post('/analyze', patientData)
+  // sync: wait for the result even when the backend runs analyses on a job queue
+  const response = await api.post('/analyze', patientData, { params: { sync: true } })
   return response.data
 }
 